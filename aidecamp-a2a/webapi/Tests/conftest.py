@@ -0,0 +1,43 @@
+"""Shared fixtures: an offline agent and application backed by the fake chat service."""
+
+import runpy
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+WEBAPI_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def offline_env(monkeypatch):
+    """Configure the fake chat service with no latency, caching or archiving."""
+    monkeypatch.setenv("CHAT_SERVICE", "fake")
+    monkeypatch.setenv("FAKE_MODEL_LATENCY_MS", "0")
+    monkeypatch.setenv("RESULT_CACHE_MAX_ENTRIES", "0")
+    monkeypatch.setenv("UPLOAD_ARCHIVE", "false")
+    monkeypatch.setenv("BUTTON_CROP", "false")
+
+
+@pytest.fixture
+def make_agent(offline_env):
+    """Return a factory for agents using the fake chat service."""
+    from agent import SemanticKernelWargamingAgent
+
+    return SemanticKernelWargamingAgent
+
+
+@pytest.fixture
+def app(offline_env, monkeypatch):
+    """Return the combined application, created as the server entry point creates it."""
+    monkeypatch.chdir(WEBAPI_DIR)
+    namespace = runpy.run_path(str(WEBAPI_DIR / "__main__.py"), run_name="app")
+    return namespace["create_combined_app"]("127.0.0.1", 10999)
+
+
+def image_bytes(seed: int = 0) -> bytes:
+    """Return a small PNG whose content depends on the seed."""
+    output = BytesIO()
+    Image.new("RGB", (32, 32), (seed % 256, 80, 160)).save(output, format="PNG")
+    return output.getvalue()
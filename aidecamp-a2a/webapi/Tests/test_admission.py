@@ -0,0 +1,54 @@
+"""Tests for admission control of model-bound work."""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_full_queue_is_rejected_with_503():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout_seconds=5)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        assert (controller.in_flight, controller.queued) == (1, 1)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 503
+    assert rejected.retry_after >= 1
+    assert controller.stats().rejected == 1
+
+
+def test_exhausted_quota_is_rejected_with_429_and_retry_after():
+    # One request per minute: the second must wait about a minute, past the deadline
+    controller = AdmissionController(max_concurrency=0, requests_per_minute=1, queue_timeout_seconds=5)
+
+    async def scenario():
+        async with controller.admit():
+            pass
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 429
+    assert 55 <= rejected.retry_after <= 60
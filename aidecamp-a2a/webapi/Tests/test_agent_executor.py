@@ -0,0 +1,85 @@
+"""Tests for cancelling in-flight work through the A2A executor."""
+
+import asyncio
+import base64
+import uuid
+
+import pytest
+from a2a.server.agent_execution import RequestContext
+from a2a.server.events.event_queue import EventQueue
+from a2a.types import (
+    FilePart,
+    FileWithBytes,
+    Message,
+    MessageSendParams,
+    Part,
+    Role,
+    TaskState,
+    TaskStatusUpdateEvent,
+    TextPart,
+)
+
+from agent_executor import WargamingAgentExecutor
+from conftest import image_bytes
+
+
+def _request() -> MessageSendParams:
+    image = base64.b64encode(image_bytes(1)).decode()
+    return MessageSendParams(
+        message=Message(
+            role=Role.user,
+            messageId=str(uuid.uuid4()),
+            parts=[
+                Part(root=TextPart(text="resolve")),
+                Part(root=FilePart(file=FileWithBytes(bytes=image, mimeType="image/png"))),
+            ],
+        )
+    )
+
+
+async def _drain(queue: EventQueue) -> list:
+    events = []
+    while not queue.queue.empty():
+        events.append(await queue.dequeue_event(no_wait=True))
+    return events
+
+
+def test_cancel_ends_execute_normally_with_a_canceled_status(make_agent):
+    agent = make_agent()
+    agent.kernel.get_service("default").latency_ms = 10_000
+    executor = WargamingAgentExecutor(agent, streaming=False)
+
+    async def scenario():
+        queue = EventQueue()
+        context = RequestContext(request=_request())
+        execution = asyncio.create_task(executor.execute(context, queue))
+        await asyncio.sleep(0.2)
+        task = (await _drain(queue))[0]
+
+        await executor.cancel(RequestContext(task_id=task.id, context_id=task.contextId), queue)
+        # The executor task itself was not cancelled, so execute returns without error
+        await asyncio.wait_for(execution, timeout=5)
+        return await _drain(queue)
+
+    events = asyncio.run(scenario())
+
+    statuses = [event.status.state for event in events if isinstance(event, TaskStatusUpdateEvent)]
+    assert statuses[-1] == TaskState.canceled
+    assert not executor._running
+
+
+def test_cancelling_the_executor_task_still_raises(make_agent):
+    agent = make_agent()
+    agent.kernel.get_service("default").latency_ms = 10_000
+    executor = WargamingAgentExecutor(agent, streaming=False)
+
+    async def scenario():
+        execution = asyncio.create_task(executor.execute(RequestContext(request=_request()), EventQueue()))
+        await asyncio.sleep(0.2)
+        execution.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await execution
+
+    asyncio.run(scenario())
+
+    assert not executor._running
@@ -0,0 +1,39 @@
+"""Tests for recording turns in the game state exactly once."""
+
+import asyncio
+
+from agent import ContextMode
+from conftest import image_bytes
+from result_cache import ResultCache
+
+
+def test_coalesced_uploads_record_one_turn_and_share_its_result(make_agent):
+    agent = make_agent(context_mode=ContextMode.GAME_STATE, result_cache=ResultCache(max_entries=16))
+    agent.kernel.get_service("default").latency_ms = 50
+
+    async def scenario():
+        return await asyncio.gather(*(agent.process_image(image_bytes(1), "", "s1") for _ in range(3)))
+
+    results = asyncio.run(scenario())
+
+    state = agent.game_states.get("s1")
+    assert state.turn == 1
+    assert state.shots == len(results[0].engagements)
+    assert results[1] == results[0] and results[2] == results[0]
+    assert agent.single_flight.coalesced == 2
+
+
+def test_repeated_upload_is_a_new_turn_not_a_cache_hit(make_agent):
+    agent = make_agent(context_mode=ContextMode.GAME_STATE, result_cache=ResultCache(max_entries=16))
+
+    async def scenario():
+        first = await agent.process_image(image_bytes(1), "", "s1")
+        await agent.process_image(image_bytes(1), "", "s1")
+        return first
+
+    first = asyncio.run(scenario())
+
+    state = agent.game_states.get("s1")
+    assert state.turn == 2
+    assert state.shots == 2 * len(first.engagements)
+    assert agent.result_cache.stats().hits == 0
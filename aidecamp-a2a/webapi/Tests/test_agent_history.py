@@ -0,0 +1,54 @@
+"""Tests for session history handling around failed model calls."""
+
+import asyncio
+
+import pytest
+from semantic_kernel.contents import ImageContent
+
+from agent import ContextMode
+from conftest import image_bytes
+
+
+def _images_in(history) -> int:
+    return sum(isinstance(item, ImageContent) for message in history.messages for item in message.items)
+
+
+@pytest.mark.parametrize("context_mode", [ContextMode.COMPACT, ContextMode.FULL])
+def test_failed_model_call_leaves_no_unanswered_image(make_agent, context_mode):
+    agent = make_agent(context_mode=context_mode)
+    fake = agent.kernel.get_service("default")
+
+    async def scenario():
+        await agent.process_image(image_bytes(1), "", "s1")
+        before = len(agent.session_store.get("s1").messages)
+        fake.failure_rate = 1
+        with pytest.raises(Exception):
+            await agent.process_image(image_bytes(2), "", "s1")
+        return before
+
+    before = asyncio.run(scenario())
+
+    history = agent.session_store.get("s1")
+    assert len(history.messages) == before
+    assert [message.role.value for message in history.messages[1:]] == ["user", "assistant"]
+    assert _images_in(history) == (1 if context_mode == ContextMode.FULL else 0)
+
+
+def test_cancelled_model_call_leaves_no_unanswered_image(make_agent):
+    agent = make_agent(context_mode=ContextMode.COMPACT)
+    fake = agent.kernel.get_service("default")
+
+    async def scenario():
+        await agent.process_image(image_bytes(1), "", "s1")
+        fake.latency_ms = 10_000
+        task = asyncio.create_task(agent.process_image(image_bytes(2), "", "s1"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+    history = agent.session_store.get("s1")
+    assert [message.role.value for message in history.messages[1:]] == ["user", "assistant"]
+    assert _images_in(history) == 0
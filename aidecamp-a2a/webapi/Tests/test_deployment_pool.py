@@ -0,0 +1,82 @@
+"""Tests for failover and ejection in the deployment pool."""
+
+import asyncio
+
+import pytest
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.contents import ChatHistory
+from semantic_kernel.exceptions import ServiceResponseException
+
+from deployment_pool import DeploymentPool
+from fake_chat_completion import FakeChatCompletion
+
+
+def _fake(name: str, **kwargs) -> FakeChatCompletion:
+    return FakeChatCompletion(service_id=name, ai_model_id="fake", latency_ms=0, jitter_ms=0, seed=0, **kwargs)
+
+
+def _pool(*deployments: tuple[str, FakeChatCompletion], **kwargs) -> DeploymentPool:
+    return DeploymentPool(list(deployments), ai_model_id="pool", **kwargs)
+
+
+def _call(pool: DeploymentPool):
+    history = ChatHistory()
+    history.add_user_message("resolve")
+    return asyncio.run(pool.get_chat_message_contents(history, OpenAIChatPromptExecutionSettings()))
+
+
+def _stats(pool: DeploymentPool) -> dict:
+    return {stats.name: stats for stats in pool.stats()}
+
+
+def test_server_error_ejects_the_deployment_and_fails_over():
+    pool = _pool(("broken", _fake("broken", failure_rate=1)), ("spare", _fake("spare")), cooldown_seconds=10)
+
+    _call(pool)
+    _call(pool)
+
+    stats = _stats(pool)
+    assert not stats["broken"].healthy
+    assert 9 < stats["broken"].cooldown_remaining_seconds <= 10
+    # While the broken deployment cools down every call goes to the spare
+    assert (stats["broken"].requests, stats["spare"].requests) == (1, 2)
+
+
+def test_cooldown_doubles_with_consecutive_failures_up_to_the_maximum():
+    pool = _pool(("only", _fake("only", failure_rate=1)), cooldown_seconds=10, max_cooldown_seconds=15)
+    only = pool._deployments[0]
+
+    cooldowns = []
+    for _ in range(3):
+        with pytest.raises(ServiceResponseException):
+            _call(pool)
+        cooldowns.append(round(only.stats().cooldown_remaining_seconds))
+
+    assert cooldowns == [10, 15, 15]
+    assert only.ejections == 3
+
+
+def test_throttled_deployment_cools_down_for_its_retry_after():
+    throttled = _fake("throttled", failure_rate=1, failure_status_code=429, retry_after_seconds=30)
+    pool = _pool(("throttled", throttled), ("spare", _fake("spare")), cooldown_seconds=1)
+
+    _call(pool)
+
+    stats = _stats(pool)
+    assert stats["throttled"].throttled == 1
+    assert 29 < stats["throttled"].cooldown_remaining_seconds <= 30
+
+
+def test_deployment_returns_to_rotation_after_its_cooldown():
+    pool = _pool(("flaky", _fake("flaky", failure_rate=1)), ("spare", _fake("spare")), cooldown_seconds=0.05)
+    flaky = pool._deployments[0]
+    _call(pool)
+    assert not flaky.healthy
+
+    flaky.service.failure_rate = 0
+    asyncio.run(asyncio.sleep(0.1))
+    _call(pool)
+
+    assert flaky.healthy
+    assert flaky.consecutive_failures == 0
+    assert flaky.requests == 2
@@ -0,0 +1,88 @@
+"""Tests for unit matching in the per-session game state."""
+
+import pytest
+
+from game_state import GameState
+from models import (
+    Characteristics,
+    CombatResult,
+    Coordinates,
+    Distance,
+    EngagementResult,
+    Pose,
+    ScenarioModel,
+    ScenarioOutcome,
+    Weapon,
+)
+
+
+def _soldier(x: int, y: int, weapon: Weapon = Weapon.RIFLE) -> Characteristics:
+    return Characteristics(pose=Pose.STANDING, weapon=weapon, coordinates=Coordinates(x=x, y=y), height=60)
+
+
+def _result(*engagements: tuple[Characteristics, Characteristics, bool]) -> CombatResult:
+    results = [
+        EngagementResult(
+            scenario=ScenarioModel(
+                firing=firing,
+                target=target,
+                distance=Distance(value=30, unit="cm", estimated=True),
+            ),
+            outcome=ScenarioOutcome(
+                firing_modifier=0,
+                target_modifier=0,
+                distance_modifier=0,
+                rolled_dice=20 if hit else 1,
+                hit_or_miss=hit,
+            ),
+        )
+        for firing, target, hit in engagements
+    ]
+    return CombatResult(scenario=results[0].scenario, outcome=results[0].outcome, engagements=results)
+
+
+def test_close_firer_and_target_with_same_weapon_stay_apart():
+    state = GameState(match_radius=100)
+
+    state.apply(_result((_soldier(100, 100), _soldier(150, 100), False)))
+
+    assert len(state.units) == 2
+
+
+def test_hit_removes_only_the_target_standing_close_to_the_firer():
+    state = GameState(match_radius=100)
+    state.apply(_result((_soldier(100, 100), _soldier(150, 100), False)))
+    firer_id, target_id = state.units
+
+    state.apply(_result((_soldier(105, 100), _soldier(155, 100), True)))
+
+    assert list(state.units) == [firer_id]
+    assert state.units[firer_id].shots == 2
+    assert [unit.unit_id for unit in state.casualties] == [target_id]
+
+
+# The nearer rifleman takes over the known unit whichever engagement lists it first
+@pytest.mark.parametrize("order", [(110, 130), (130, 110)])
+def test_unit_matches_the_nearest_soldier_once_per_turn(order):
+    state = GameState(match_radius=100)
+    state.apply(_result((_soldier(100, 100), _soldier(400, 400, Weapon.PISTOL), False)))
+
+    state.apply(_result(*(
+        (_soldier(x, 100), _soldier(400, 400, Weapon.PISTOL), False) for x in order
+    )))
+
+    riflemen = sorted((unit.unit_id, unit.x) for unit in state.units.values() if unit.weapon == Weapon.RIFLE)
+    assert riflemen == [(1, 110), (3, 130)]
+
+
+def test_target_shared_by_two_firers_is_one_unit_and_one_casualty():
+    state = GameState(match_radius=100)
+
+    state.apply(_result(
+        (_soldier(100, 100), _soldier(300, 100, Weapon.PISTOL), True),
+        (_soldier(100, 300), _soldier(300, 100, Weapon.PISTOL), True),
+    ))
+
+    assert state.casualty_count == 1
+    assert [unit.hits for unit in state.casualties] == [2]
+    assert len(state.units) == 2
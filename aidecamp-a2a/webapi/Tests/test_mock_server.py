@@ -0,0 +1,54 @@
+"""Tests for the streaming multipart parser of the mock server."""
+
+from io import BytesIO
+
+import pytest
+
+from mock_server import MultipartError, UploadTooLargeError, read_multipart_file
+
+BOUNDARY = b"xyzBOUNDARYxyz"
+
+
+def _body(*parts: tuple[str, str, bytes]) -> bytes:
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += b"--" + BOUNDARY + b"\r\n"
+        body += f"Content-Disposition: {disposition}\r\nContent-Type: image/png\r\n\r\n".encode()
+        body += data + b"\r\n"
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+def _read(body: bytes, **kwargs):
+    stream = BytesIO(body)
+    uploaded = read_multipart_file(stream, len(body), BOUNDARY, **kwargs)
+    # The whole body is consumed so the connection can be reused
+    assert stream.tell() == len(body)
+    return uploaded
+
+
+def test_returns_the_named_file_among_other_parts():
+    # Larger than one read chunk, with a near-delimiter inside the data
+    image = b"\r\n--xyzBOUNDAR" + bytes(range(256)) * 600
+    body = _body(("text", "", b"30 cm"), ("image", "table.png", image), ("other", "b.png", b"ignored"))
+
+    uploaded = _read(body)
+
+    assert (uploaded.filename, uploaded.content_type) == ("table.png", "image/png")
+    assert uploaded.data == image
+
+
+def test_returns_none_without_the_field():
+    assert _read(_body(("text", "", b"30 cm"))) is None
+
+
+def test_rejects_a_file_over_the_limit_after_reading_the_body():
+    with pytest.raises(UploadTooLargeError):
+        _read(_body(("image", "table.png", b"x" * 101)), max_bytes=100)
+
+
+def test_rejects_a_body_without_the_closing_boundary():
+    body = _body(("image", "table.png", b"data"))[: -len(b"--" + BOUNDARY + b"--\r\n")]
+
+    with pytest.raises(MultipartError):
+        _read(body)
@@ -0,0 +1,57 @@
+"""Tests for the two-tier scenario cache."""
+
+import asyncio
+
+from conftest import image_bytes
+from fake_chat_completion import scenario_for_image
+from models import TurnScenarioModel
+from result_cache import ResultCache, cache_key
+
+
+def _scenario(seed: int) -> TurnScenarioModel:
+    return TurnScenarioModel.model_validate(scenario_for_image(image_bytes(seed)))
+
+
+def test_memory_tier_evicts_the_least_recently_used_entry():
+    cache = ResultCache(max_entries=2)
+
+    async def scenario():
+        await cache.put("a", _scenario(1))
+        await cache.put("b", _scenario(2))
+        # Reading "a" makes "b" the least recently used
+        await cache.get("a")
+        await cache.put("c", _scenario(3))
+        return [await cache.get(key) is not None for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+    stats = cache.stats()
+    assert (stats.entries, stats.evictions) == (2, 1)
+
+
+def test_sqlite_tier_survives_a_restart(tmp_path):
+    db_path = str(tmp_path / "cache" / "results.db")
+    key = cache_key(image_bytes(1), "resolve")
+    stored = _scenario(1)
+
+    first = ResultCache(db_path=db_path)
+    asyncio.run(first.put(key, stored))
+    first.close()
+
+    restarted = ResultCache(db_path=db_path)
+    try:
+        assert asyncio.run(restarted.get(key)) == stored
+        assert asyncio.run(restarted.get(cache_key(image_bytes(2), "resolve"))) is None
+        assert (restarted.stats().hits, restarted.stats().misses) == (1, 1)
+    finally:
+        restarted.close()
+
+
+def test_key_depends_on_image_text_and_context():
+    keys = {
+        cache_key(image_bytes(1)),
+        cache_key(image_bytes(2)),
+        cache_key(image_bytes(1), "30 cm"),
+        cache_key(image_bytes(1), "", "compact:s1"),
+    }
+
+    assert len(keys) == 4
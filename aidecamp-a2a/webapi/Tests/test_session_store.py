@@ -0,0 +1,47 @@
+"""Tests for eviction from the in-memory session store."""
+
+import time
+
+from semantic_kernel.contents import ChatHistory
+
+from session_store import InMemorySessionStore
+
+
+def _history(text: str) -> ChatHistory:
+    history = ChatHistory()
+    history.add_user_message(text)
+    return history
+
+
+def test_idle_sessions_expire_after_the_ttl():
+    store = InMemorySessionStore(ttl_seconds=0.05)
+    store.put("s1", _history("first"))
+
+    time.sleep(0.1)
+    store.put("s2", _history("second"))
+
+    assert store.get("s1") is None
+    assert store.get("s2") is not None
+    assert store.stats().evictions == 1
+
+
+def test_byte_cap_evicts_least_recently_used_sessions():
+    store = InMemorySessionStore(max_bytes=250)
+    store.put("s1", _history("a" * 100))
+    store.put("s2", _history("b" * 100))
+    # Using s1 leaves s2 as the least recently used
+    store.get("s1")
+
+    store.put("s3", _history("c" * 100))
+
+    assert "s1" in store and "s3" in store
+    assert "s2" not in store
+    assert store.stats().size_bytes == 200
+
+
+def test_session_over_the_byte_cap_on_its_own_is_kept():
+    store = InMemorySessionStore(max_bytes=50)
+
+    store.put("s1", _history("a" * 100))
+
+    assert "s1" in store
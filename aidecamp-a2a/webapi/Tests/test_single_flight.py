@@ -0,0 +1,54 @@
+"""Tests for coalescing concurrent identical calls."""
+
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert results == [1] * 5
+    assert calls == 1
+    assert flight.coalesced == 4
+    assert flight.in_flight == 0
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model failed")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert [type(result) for result in results] == [RuntimeError] * 3
+    assert flight.in_flight == 0
+
+
+def test_new_call_starts_after_the_previous_one_finished():
+    flight = SingleFlight()
+
+    async def scenario():
+        first = await flight.do("key", lambda: asyncio.sleep(0, result="first"))
+        second = await flight.do("key", lambda: asyncio.sleep(0, result="second"))
+        return first, second
+
+    assert asyncio.run(scenario()) == ("first", "second")
+    assert flight.coalesced == 0
@@ -0,0 +1,29 @@
+"""Tests for the hit odds calculated by the turn manager."""
+
+from models import Pose, Weapon
+from turn_manager import DICE_SIDES, TurnManagerPlugin
+
+SIMULATIONS = 200_000
+
+
+def test_monte_carlo_rates_agree_with_exact_odds():
+    plugin = TurnManagerPlugin()
+
+    result = plugin.calculate_odds_grid(list(Weapon), list(Pose), [10, 60, 200], simulations=SIMULATIONS)
+
+    assert result.simulations == SIMULATIONS
+    assert len(result.odds) == len(Weapon) * len(Pose) * 3
+    for odds in result.odds:
+        assert 0 <= odds.hit_probability <= 1
+        # Well over four standard deviations of a binomial rate at this sample size
+        assert abs(odds.simulated_hit_rate - odds.hit_probability) < 0.005
+
+
+def test_exact_odds_count_the_die_faces_above_the_total_modifier():
+    plugin = TurnManagerPlugin()
+
+    (odds,) = plugin.calculate_odds_grid([Weapon.RIFLE], [Pose.STANDING], [30]).odds
+
+    total = odds.firing_modifier + odds.target_modifier + odds.distance_modifier
+    assert odds.hit_probability == max(DICE_SIDES - total, 0) / DICE_SIDES
+    assert odds.simulated_hit_rate is None
@@ -0,0 +1,47 @@
+"""Tests for upload validation on the combat routes."""
+
+import pytest
+from starlette.testclient import TestClient
+
+from conftest import image_bytes
+
+
+BATCH_LIMIT = 24
+
+
+@pytest.fixture
+def client(request, monkeypatch):
+    monkeypatch.setenv("BATCH_MAX_IMAGES", str(BATCH_LIMIT))
+    # The limit is read when the app is created
+    with TestClient(request.getfixturevalue("app")) as client:
+        yield client
+
+
+def _images(count: int) -> list[tuple[str, tuple[str, bytes, str]]]:
+    return [("image", (f"{index}.png", image_bytes(index), "image/png")) for index in range(count)]
+
+
+# One over the limit passes the parser and is caught afterwards; more stop the parser itself
+@pytest.mark.parametrize("count", [BATCH_LIMIT + 1, BATCH_LIMIT + 6])
+def test_batch_over_the_limit_is_rejected_with_400(client, count):
+    response = client.post("/api/combat/batch", files=_images(count))
+
+    assert response.status_code == 400
+    assert response.json() == {"error": f"At most {BATCH_LIMIT} images can be uploaded in one batch."}
+
+
+def test_batch_within_the_limit_is_processed(client):
+    response = client.post("/api/combat/batch", files=_images(2))
+
+    assert response.status_code == 200
+
+
+def test_malformed_multipart_body_is_rejected_with_400(client):
+    response = client.post(
+        "/api/combat",
+        content=b"--boundary\r\nContent-Disposition: form-data\r\n\r\nno name\r\n--boundary--\r\n",
+        headers={"Content-Type": "multipart/form-data; boundary=boundary"},
+    )
+
+    assert response.status_code == 400
+    assert response.json()["error"].startswith("Malformed upload")
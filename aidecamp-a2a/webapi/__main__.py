@@ -1,5 +1,8 @@
 """Main application entry point with dual API support."""
 
+import asyncio
+import contextlib
+import dataclasses
 import logging
 import os
 from io import BytesIO
@@ -8,30 +11,55 @@ from pathlib import Path
 import click
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
+from a2a.server.tasks import InMemoryTaskStore, TaskStore
 from a2a.types import AgentCapabilities, AgentCard, AgentSkill
 from dotenv import load_dotenv
 from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
 from starlette.applications import Starlette
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.formparsers import MultiPartException
 from starlette.middleware import Middleware
+from starlette.requests import Request
 from starlette.routing import Mount, Route
 
-from agent import SemanticKernelWargamingAgent
+from admission import AdmissionRejected
+from agent import ContextMode, SemanticKernelWargamingAgent
 from agent_executor import WargamingAgentExecutor
+from metrics import REGISTRY, count_error, time_stage
+from models import OddsResult, Pose, ScenarioModel, Weapon
+from sqlite_task_store import SQLiteTaskStore
+from turn_manager import LONG_RANGE_CM
+from upload_store import UploadStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Upper bounds on simulated rolls, and on values per grid axis and grid size, per /api/odds request
+MAX_SIMULATIONS = 1_000_000
+MAX_ODDS_AXIS_VALUES = 32
+MAX_ODDS_COMBINATIONS = 1024
+
 
 async def combat_endpoint(request):
     """Traditional /combat endpoint for webapp compatibility."""
     try:
-        # Parse multipart form data
-        form = await request.form()
+        # Reject oversized bodies before parsing them
+        max_upload_bytes = request.app.state.max_upload_bytes
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_upload_bytes:
+            return _upload_too_large(max_upload_bytes)
+
+        # Parse multipart form data, stopping once the body passes the limit
+        try:
+            with time_stage("multipart_parse"):
+                form = await _limit_body(request, max_upload_bytes).form()
+        except (StarletteHTTPException, MultiPartException) as e:
+            return _malformed_form(e)
         
         if "image" not in form:
             return JSONResponse(
@@ -53,28 +81,24 @@ async def combat_endpoint(request):
                 content={"error": "Uploaded file is not an image."}
             )
         
-        # Read image bytes
-        image_bytes = await file.read()
+        # Read image bytes, reading at most one byte past the limit
+        image_bytes = await file.read(max_upload_bytes + 1)
+        if len(image_bytes) > max_upload_bytes:
+            return _upload_too_large(max_upload_bytes)
         
-        # Save the image file to data/uploads directory (following .NET pattern)
-        uploads_dir = Path(__file__).parent / "data" / "uploads"
-        uploads_dir.mkdir(parents=True, exist_ok=True)
-        
-        file_path = uploads_dir / file.filename
-        with open(file_path, "wb") as f:
-            f.write(image_bytes)
-        
-        logger.info(f"Image saved to: {file_path}")
+        # Archive to data/uploads (following .NET pattern) without blocking the request
+        request.app.state.upload_store.save_in_background(image_bytes, file.content_type)
         
         try:
-            # Process with our agent
-            logger.info("Creating SemanticKernelWargamingAgent")
-            agent = SemanticKernelWargamingAgent()
-            logger.info("Agent created successfully")
+            # Process with the shared application agent
+            agent = request.app.state.agent
             
             logger.info("Processing image with agent")
-            result = await agent.process_image(image_bytes, "", "default")
+            # The route is stateless, so each upload gets a fresh one-shot context
+            result = await agent.process_image(image_bytes, "", "default", ContextMode.ONE_SHOT)
             logger.info(f"Processing complete, result: {result}")
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Error during agent processing: {e}")
             import traceback
@@ -89,7 +113,16 @@ async def combat_endpoint(request):
             content=response_data
         )
         
+    except _UploadTooLarge as e:
+        return _upload_too_large(e.max_bytes)
+    except AdmissionRejected as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
+        count_error(e)
         logger.error(f"Error in combat endpoint: {e}")
         return JSONResponse(
             status_code=500,
@@ -97,28 +130,256 @@ async def combat_endpoint(request):
         )
 
 
+async def combat_batch_endpoint(request):
+    """Resolve several uploaded images in one request, with bounded concurrency."""
+    try:
+        max_upload_bytes = request.app.state.max_upload_bytes
+        max_batch_images = request.app.state.max_batch_images
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_upload_bytes * max_batch_images:
+            return _upload_too_large(max_upload_bytes * max_batch_images)
+
+        too_many_images = JSONResponse(
+            status_code=400,
+            content={"error": f"At most {max_batch_images} images can be uploaded in one batch."}
+        )
+        try:
+            with time_stage("multipart_parse"):
+                form = await _limit_body(request, max_upload_bytes * max_batch_images).form(
+                    max_files=max_batch_images + 1
+                )
+        except (StarletteHTTPException, MultiPartException) as e:
+            # The parser stops at max_files, which is how oversized batches usually end
+            return too_many_images if "Too many files" in _form_error_message(e) else _malformed_form(e)
+        files = [file for file in form.getlist("image") if getattr(file, "filename", "")]
+        if not files:
+            return JSONResponse(
+                status_code=400,
+                content={"error": "No image file uploaded."}
+            )
+        if len(files) > max_batch_images:
+            return too_many_images
+        for file in files:
+            if not file.content_type.startswith("image/"):
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": f"Uploaded file {file.filename} is not an image."}
+                )
+
+        images = []
+        for file in files:
+            image_bytes = await file.read(max_upload_bytes + 1)
+            if len(image_bytes) > max_upload_bytes:
+                return _upload_too_large(max_upload_bytes)
+            images.append(image_bytes)
+            request.app.state.upload_store.save_in_background(image_bytes, file.content_type)
+
+        agent = request.app.state.agent
+        logger.info(f"Processing batch of {len(images)} images with agent")
+        result = await agent.process_batch(images, "", filenames=[file.filename for file in files])
+
+        return JSONResponse(
+            status_code=200,
+            content=result.model_dump(by_alias=True)
+        )
+
+    except _UploadTooLarge as e:
+        return _upload_too_large(e.max_bytes)
+    except Exception as e:
+        count_error(e)
+        logger.error(f"Error in combat batch endpoint: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e)}
+        )
+
+
+async def odds_endpoint(request):
+    """Hit probabilities for a scenario or a weapon x pose x distance grid.
+
+    GET returns the precomputed table for the full rules space. POST accepts
+    either {"scenario": {...}} or any of "weapons", "poses" and "distances"
+    lists, plus an optional "simulations" count for a Monte Carlo cross-check.
+    """
+    turn_manager = request.app.state.agent.turn_manager
+    if request.method == "GET":
+        result = OddsResult(simulations=0, odds=turn_manager.odds_table)
+        return JSONResponse(content=result.model_dump(by_alias=True))
+
+    try:
+        body = await request.json()
+        if not isinstance(body, dict):
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Request body must be a JSON object."}
+            )
+        simulations = int(body.get("simulations", 0))
+        if not 0 <= simulations <= MAX_SIMULATIONS:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"simulations must be between 0 and {MAX_SIMULATIONS}."}
+            )
+        if "scenario" in body:
+            scenario = ScenarioModel.model_validate(body["scenario"])
+            odds = turn_manager.calculate_odds(scenario, simulations)
+            result = OddsResult(simulations=simulations, odds=[odds])
+        else:
+            axes = {
+                "weapons": body.get("weapons", list(Weapon)),
+                "poses": body.get("poses", list(Pose)),
+                "distances": body.get("distances", [0, LONG_RANGE_CM]),
+            }
+            for name, values in axes.items():
+                if not isinstance(values, list) or len(values) > MAX_ODDS_AXIS_VALUES:
+                    return JSONResponse(
+                        status_code=400,
+                        content={"error": f"{name} must be a list of at most {MAX_ODDS_AXIS_VALUES} values."}
+                    )
+            if len(axes["weapons"]) * len(axes["poses"]) * len(axes["distances"]) > MAX_ODDS_COMBINATIONS:
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": f"The grid may have at most {MAX_ODDS_COMBINATIONS} combinations."}
+                )
+            result = turn_manager.calculate_odds_grid(
+                [Weapon(weapon) for weapon in axes["weapons"]],
+                [Pose(pose) for pose in axes["poses"]],
+                [int(distance) for distance in axes["distances"]],
+                simulations,
+            )
+    except (TypeError, ValueError, ValidationError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": str(e)}
+        )
+
+    return JSONResponse(content=result.model_dump(by_alias=True))
+
+
+class _UploadTooLarge(Exception):
+    """Raised while reading a request body that passes the upload limit."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+def _limit_body(request: Request, max_bytes: int) -> Request:
+    """Return the request with a body stream that raises _UploadTooLarge past max_bytes.
+
+    Content-Length is checked up front, but a chunked body has none, so the
+    bytes are also counted as they arrive instead of buffering them all.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise _UploadTooLarge(max_bytes)
+        return message
+
+    return Request(request.scope, receive)
+
+
+def _form_error_message(error: Exception) -> str:
+    # Starlette wraps parser errors in an HTTPException inside an application
+    return error.detail if isinstance(error, StarletteHTTPException) else error.message
+
+
+def _malformed_form(error: Exception) -> JSONResponse:
+    return JSONResponse(
+        status_code=400,
+        content={"error": f"Malformed upload: {_form_error_message(error)}"}
+    )
+
+
+def _upload_too_large(max_upload_bytes: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=413,
+        content={"error": f"Upload exceeds the {max_upload_bytes} byte limit."}
+    )
+
+
+async def stats_endpoint(request):
+    """Admission, deployment pool, hedging, session store, game state, result cache, coalescing, image preprocessing and prompt cache statistics."""
+    agent = request.app.state.agent
+    result_cache = agent.result_cache
+    preprocessor_stats = agent.image_preprocessor.stats()
+    prompt_cache_stats = agent.prompt_cache_stats()
+    deployment_stats = agent.deployment_stats()
+    hedge_stats = agent.hedge_stats()
+    return JSONResponse({
+        "sessions": dataclasses.asdict(agent.session_store.stats()),
+        "admission": dataclasses.asdict(agent.admission.stats()),
+        "deployments": [dataclasses.asdict(stats) for stats in deployment_stats] if deployment_stats is not None else None,
+        "hedging": {
+            "enabled": agent.hedge_requests,
+            **dataclasses.asdict(hedge_stats),
+            "hedge_rate": hedge_stats.hedge_rate,
+        } if hedge_stats is not None else None,
+        "game_states": {
+            "entries": len(agent.game_states),
+            "evictions": agent.game_states.evictions,
+        },
+        "result_cache": dataclasses.asdict(result_cache.stats()) if result_cache else None,
+        "single_flight": {
+            "in_flight": agent.single_flight.in_flight,
+            "coalesced": agent.single_flight.coalesced,
+        },
+        "image_preprocessor": {
+            **dataclasses.asdict(preprocessor_stats),
+            "bytes_saved": preprocessor_stats.bytes_saved,
+        },
+        "prompt_cache": {
+            **dataclasses.asdict(prompt_cache_stats),
+            "hit_rate": prompt_cache_stats.hit_rate,
+            "prompt_reloads": agent.prompt_file.reloads,
+        },
+    })
+
+
+async def metrics_endpoint(request):
+    """Prometheus text exposition of request stage latencies and counters."""
+    return PlainTextResponse(REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
+
 async def home_endpoint(request):
     """Home endpoint."""
     return JSONResponse({
         "message": "AI de Camp - A2A Wargaming Service",
         "endpoints": {
             "traditional_api": "/api/combat",
-            "a2a_protocol": "/a2a"
+            "batch": "/api/combat/batch",
+            "odds": "/api/odds",
+            "stats": "/api/stats",
+            "a2a_protocol": "/a2a",
+            "metrics": "/metrics"
         }
     })
 
 
-def create_combined_app(host: str, port: int) -> Starlette:
+def create_combined_app(
+    host: str,
+    port: int,
+    streaming: bool = True,
+    task_store: TaskStore | None = None,
+) -> Starlette:
     """Create a combined Starlette app with both A2A and traditional APIs."""
     
+    # One agent per process, shared by both APIs: a single kernel, chat
+    # completion client and connection pool instead of one per request
+    agent = SemanticKernelWargamingAgent()
+
     # Create the A2A server
     request_handler = DefaultRequestHandler(
-        agent_executor=WargamingAgentExecutor(),
-        task_store=InMemoryTaskStore(),
+        agent_executor=WargamingAgentExecutor(agent, streaming=streaming),
+        task_store=task_store or InMemoryTaskStore(),
     )
 
     a2a_server = A2AStarletteApplication(
-        agent_card=get_agent_card(host, port), 
+        agent_card=get_agent_card(host, port, streaming), 
         http_handler=request_handler
     )
     
@@ -126,6 +387,9 @@ def create_combined_app(host: str, port: int) -> Starlette:
     traditional_routes = [
         Route("/", home_endpoint, methods=["GET"]),
         Route("/combat", combat_endpoint, methods=["POST"]),
+        Route("/combat/batch", combat_batch_endpoint, methods=["POST"]),
+        Route("/odds", odds_endpoint, methods=["GET", "POST"]),
+        Route("/stats", stats_endpoint, methods=["GET"]),
     ]
     
     # CORS middleware for traditional API
@@ -142,6 +406,48 @@ def create_combined_app(host: str, port: int) -> Starlette:
         routes=traditional_routes,
         middleware=[cors_middleware]
     )
+    traditional_app.state.agent = agent
+    traditional_app.state.max_upload_bytes = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+    traditional_app.state.max_batch_images = int(os.getenv('BATCH_MAX_IMAGES', '24'))
+    upload_store = UploadStore(
+        Path(__file__).parent / "data" / "uploads",
+        enabled=os.getenv('UPLOAD_ARCHIVE', 'true').lower() == 'true',
+        sample_rate=float(os.getenv('UPLOAD_SAMPLE_RATE', '1.0')),
+        retention_bytes=int(os.getenv('UPLOAD_RETENTION_BYTES', str(1024 * 1024 * 1024))),
+    )
+    traditional_app.state.upload_store = upload_store
+
+    # Gauges are sampled from the live objects when /metrics is scraped
+    REGISTRY.gauge(
+        "wargaming_active_sessions",
+        "Sessions currently held in the session store.",
+        lambda: agent.session_store.stats().entries,
+    )
+    REGISTRY.gauge(
+        "wargaming_session_store_bytes",
+        "Estimated size of all stored session histories.",
+        lambda: agent.session_store.stats().size_bytes,
+    )
+    REGISTRY.gauge(
+        "wargaming_active_games",
+        "Sessions currently holding a game state.",
+        lambda: len(agent.game_states),
+    )
+    REGISTRY.gauge(
+        "wargaming_admission_queue_depth",
+        "Model-bound requests waiting for admission.",
+        lambda: agent.admission.queued,
+    )
+    REGISTRY.gauge(
+        "wargaming_admission_in_flight",
+        "Model-bound requests holding an admission slot.",
+        lambda: agent.admission.in_flight,
+    )
+    REGISTRY.gauge(
+        "wargaming_model_calls_in_flight",
+        "Distinct model calls currently running.",
+        lambda: agent.single_flight.in_flight,
+    )
     
     # Build the A2A app
     a2a_app = a2a_server.build()
@@ -149,19 +455,37 @@ def create_combined_app(host: str, port: int) -> Starlette:
     # Combine both apps
     combined_routes = [
         Route("/", home_endpoint, methods=["GET"]),  # Root endpoint
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
         Mount("/api", traditional_app),  # Traditional API under /api
         Mount("/a2a", a2a_app),         # A2A protocol at /a2a
     ]
     
-    combined_app = Starlette(routes=combined_routes)
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        # Warm the agent before uvicorn reports startup complete
+        await agent.warm_up()
+        sweeper = asyncio.create_task(
+            upload_store.run_sweeper(float(os.getenv('UPLOAD_SWEEP_INTERVAL_SECONDS', '300')))
+        )
+        try:
+            yield
+        finally:
+            sweeper.cancel()
+            await upload_store.drain()
+            await agent.close()
+            if isinstance(task_store, SQLiteTaskStore):
+                task_store.close()
+
+    combined_app = Starlette(routes=combined_routes, lifespan=lifespan)
+    combined_app.state.agent = agent
     
     return combined_app
 
 
-def get_agent_card(host: str, port: int) -> AgentCard:
+def get_agent_card(host: str, port: int, streaming: bool = True) -> AgentCard:
     """Returns the Agent Card for the Wargaming Agent."""
     # Build the agent card
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=streaming)
     skill_wargaming = AgentSkill(
         id='wargaming_analysis',
         name='Wargaming Scenario Analysis',
@@ -178,6 +502,21 @@ def get_agent_card(host: str, port: int) -> AgentCard:
         ],
     )
 
+    skill_batch = AgentSkill(
+        id='wargaming_batch_analysis',
+        name='Batch Wargaming Scenario Analysis',
+        description=(
+            'Resolves several toy soldier battle scenes sent as image parts of one message. '
+            'Images are analysed concurrently and results are returned in input order, '
+            'with an error entry for any image that could not be resolved.'
+        ),
+        tags=['wargaming', 'image-analysis', 'batch', 'combat', 'semantic-kernel'],
+        examples=[
+            'Resolve all of these shots for this turn.',
+            'Calculate the combat outcome for each of these images.',
+        ],
+    )
+
     agent_card = AgentCard(
         name='AI de Camp Wargaming Agent',
         description=(
@@ -190,7 +529,7 @@ def get_agent_card(host: str, port: int) -> AgentCard:
         defaultInputModes=['text', 'image'],
         defaultOutputModes=['text'],
         capabilities=capabilities,
-        skills=[skill_wargaming],
+        skills=[skill_wargaming, skill_batch],
     )
 
     return agent_card
@@ -199,7 +538,11 @@ def get_agent_card(host: str, port: int) -> AgentCard:
 @click.command()
 @click.option('--host', default='localhost', help='Host to bind to')
 @click.option('--port', default=10020, type=int, help='Port to bind to')
-def main(host: str, port: int):
+@click.option('--streaming/--no-streaming', default=True, help='Stream A2A progress updates')
+@click.option('--task-store', 'task_store_type', type=click.Choice(['memory', 'sqlite']), default='memory', help='A2A task store backend')
+@click.option('--task-db', default='data/tasks.db', help='SQLite database file for the sqlite task store')
+@click.option('--task-ttl', default=86400, type=float, help='Seconds after the last update before a stored task expires')
+def main(host: str, port: int, streaming: bool, task_store_type: str, task_db: str, task_ttl: float):
     """Starts the Wargaming Agent server with both A2A and traditional API support."""
     
     # Override with environment variables if available
@@ -207,7 +550,12 @@ def main(host: str, port: int):
     port = int(os.getenv('PORT', str(port)))
     
     # Create the combined application
-    app = create_combined_app(host, port)
+    task_store = None
+    if task_store_type == 'sqlite':
+        task_store = SQLiteTaskStore(task_db, ttl_seconds=task_ttl)
+        logger.info(f"Using SQLite task store: {task_db}")
+
+    app = create_combined_app(host, port, streaming, task_store)
     
     import uvicorn
     
@@ -0,0 +1,253 @@
+"""Admission control for model-bound requests.
+
+A burst of uploads that fans straight out to the model endpoint runs into
+its rate limits, and every request slows down together. The controller caps
+concurrent model work, paces it to the requests-per-minute and
+tokens-per-minute quota with token buckets, and keeps a bounded FIFO queue
+with a deadline, so excess load is turned away at once with a retry hint
+instead of piling up.
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the moving averages of hold time and token use
+SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted before its deadline.
+
+    Args:
+        message: Human-readable reason.
+        status_code: HTTP status to answer with, 429 for quota and 503 for overload.
+        retry_after: Whole seconds after which a retry is likely to be admitted.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Budget refilled continuously at a per-minute rate, up to one minute's worth.
+
+    The level may go negative when actual usage turns out higher than
+    charged; later requests then wait for the debt to be repaid.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self._level = per_minute
+        self._updated = time.monotonic()
+
+    @property
+    def level(self) -> float:
+        self._refill()
+        return self._level
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until the amount is available, 0 if it is now."""
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self._level -= amount
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self._level + (now - self._updated) * self.rate, self.capacity)
+        self._updated = now
+
+
+@dataclass
+class Permit:
+    """Capacity granted to one admitted request."""
+    charged_tokens: float
+    used_tokens: int = 0
+
+
+@dataclass
+class AdmissionStats:
+    """Snapshot of admission counters and occupancy."""
+    in_flight: int
+    queued: int
+    admitted: int
+    rejected: int
+    mean_wait_seconds: float
+    tokens_per_request: float
+
+
+_current_permit: contextvars.ContextVar[Optional[Permit]] = contextvars.ContextVar("current_permit", default=None)
+
+
+class AdmissionController:
+    """Limits concurrency and rate of model-bound work, queueing a bounded backlog.
+
+    Args:
+        max_concurrency: Requests holding a slot at once; 0 disables the limit.
+        requests_per_minute: Request quota; 0 disables it.
+        tokens_per_minute: Token quota; 0 disables it.
+        tokens_per_request: Initial token estimate per request, refined from reported usage.
+        max_queue: Requests allowed to wait for admission; more are rejected at once.
+        queue_timeout_seconds: Longest a request waits before it is rejected.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        tokens_per_request: float = 2000,
+        max_queue: int = 32,
+        queue_timeout_seconds: float = 30,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.tokens_per_request = tokens_per_request
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        # Waiters pass through one at a time, in arrival order
+        self._head = asyncio.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._hold_seconds = 1.0
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[Permit]:
+        """Hold a slot and rate-limit budget for the enclosed model-bound work.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline passes first.
+        """
+        if not self._can_start_now():
+            self._check_queue()
+        start = time.monotonic()
+        self._queued += 1
+        try:
+            permit = await asyncio.wait_for(self._acquire(), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self._reject("timeout", 503, "Timed out waiting for model capacity")
+        finally:
+            self._queued -= 1
+        waited = time.monotonic() - start
+        self._admitted += 1
+        self._total_wait += waited
+        ADMISSION_WAIT_SECONDS.observe(waited)
+
+        self._in_flight += 1
+        token = _current_permit.set(permit)
+        try:
+            yield permit
+        finally:
+            _current_permit.reset(token)
+            self._in_flight -= 1
+            if self._slots is not None:
+                self._slots.release()
+            self._hold_seconds += SMOOTHING * (time.monotonic() - start - waited - self._hold_seconds)
+            self._settle(permit)
+
+    def record_tokens(self, tokens: int) -> None:
+        """Count tokens reported by the model against the current request's permit."""
+        permit = _current_permit.get()
+        if permit is not None:
+            permit.used_tokens += tokens
+        elif self._tokens is not None:
+            # Usage outside an admitted request still spends the quota
+            self._tokens.take(tokens)
+
+    def stats(self) -> AdmissionStats:
+        return AdmissionStats(
+            in_flight=self._in_flight,
+            queued=self._queued,
+            admitted=self._admitted,
+            rejected=self._rejected,
+            mean_wait_seconds=self._total_wait / self._admitted if self._admitted else 0.0,
+            tokens_per_request=self.tokens_per_request,
+        )
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _can_start_now(self) -> bool:
+        return (
+            self._queued == 0
+            and (self._slots is None or not self._slots.locked())
+            and self._rate_wait() == 0
+        )
+
+    def _check_queue(self) -> None:
+        """Reject at once when waiting cannot end in admission."""
+        # Requests that will take a free slot do not occupy the queue
+        free_slots = max(self.max_concurrency - self._in_flight, 0) if self.max_concurrency > 0 else 0
+        if self._queued >= self.max_queue + free_slots:
+            self._reject("queue_full", 503, "Too many requests waiting for model capacity")
+        rate_wait = self._rate_wait()
+        if rate_wait > self.queue_timeout_seconds:
+            self._reject("rate_limited", 429, "Model quota exhausted", retry_after=rate_wait)
+
+    async def _acquire(self) -> Permit:
+        async with self._head:
+            if self._slots is not None:
+                await self._slots.acquire()
+            try:
+                while (wait := self._rate_wait()) > 0:
+                    await asyncio.sleep(wait)
+            except BaseException:
+                if self._slots is not None:
+                    self._slots.release()
+                raise
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(self.tokens_per_request)
+            return Permit(charged_tokens=self.tokens_per_request)
+
+    def _rate_wait(self) -> float:
+        waits = [0.0]
+        if self._requests is not None:
+            waits.append(self._requests.wait_time(1))
+        if self._tokens is not None:
+            waits.append(self._tokens.wait_time(self.tokens_per_request))
+        return max(waits)
+
+    def _settle(self, permit: Permit) -> None:
+        """Correct the token budget and estimate with the usage the model reported."""
+        if not permit.used_tokens:
+            return
+        if self._tokens is not None:
+            self._tokens.take(permit.used_tokens - permit.charged_tokens)
+        self.tokens_per_request += SMOOTHING * (permit.used_tokens - self.tokens_per_request)
+
+    def _reject(self, reason: str, status_code: int, message: str, retry_after: Optional[float] = None) -> None:
+        if retry_after is None:
+            # Time for the requests ahead to drain through the slots, or for the quota to refill
+            slots = self.max_concurrency if self.max_concurrency > 0 else 1
+            retry_after = max(self._rate_wait(), self._hold_seconds * (self._queued + 1) / slots)
+        self._rejected += 1
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        logger.warning(f"Admission rejected ({reason}): {self._queued} queued, {self._in_flight} in flight")
+        raise AdmissionRejected(message, status_code, max(math.ceil(retry_after), 1))
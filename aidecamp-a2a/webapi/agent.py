@@ -1,10 +1,15 @@
 """Wargaming agent implementation using Semantic Kernel and A2A protocol."""
 
+import asyncio
+import base64
+import json
 import logging
 import os
+from contextlib import nullcontext
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Literal
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Literal
 
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -15,6 +20,7 @@ from semantic_kernel.connectors.ai.open_ai import (
     OpenAIChatPromptExecutionSettings,
 )
 from semantic_kernel.contents import (
+    AuthorRole,
     ChatHistory,
     ChatMessageContent,
     FunctionCallContent,
@@ -26,7 +32,28 @@ from semantic_kernel.contents import (
 )
 from semantic_kernel.core_plugins import TextMemoryPlugin
 
-from models import CombatResult, ScenarioModel, ScenarioOutcome
+from admission import AdmissionController, AdmissionRejected
+from button_detector import ButtonDetector
+from deployment_pool import DeploymentPool, DeploymentStats, HedgeStats, hedging_allowed
+from fake_chat_completion import FakeChatCompletion, LatencyDistribution
+from game_state import GameStateStore
+from image_preprocessor import ImagePreprocessor
+from metrics import MODEL_TOKENS, PROMPT_CACHE_REQUESTS, REPAIRS, count_error, time_stage
+from models import (
+    BatchCombatResult,
+    BatchItemResult,
+    CombatResult,
+    Coordinates,
+    EngagementResult,
+    ScenarioModel,
+    ScenarioOutcome,
+    TurnScenarioModel,
+    strict_json_schema,
+)
+from prompt_file import PromptFile
+from result_cache import ResultCache, cache_key
+from session_store import InMemorySessionStore, SessionStore
+from single_flight import SingleFlight
 from turn_manager import TurnManagerPlugin
 
 if TYPE_CHECKING:
@@ -46,6 +73,8 @@ class ChatServices(str, Enum):
 
     AZURE_OPENAI = 'azure_openai'
     OPENAI = 'openai'
+    FAKE = 'fake'
+    POOL = 'pool'
 
 
 service_id = 'default'
@@ -69,6 +98,10 @@ def get_chat_completion_service(
         return _get_azure_openai_chat_completion_service()
     if service_name == ChatServices.OPENAI:
         return _get_openai_chat_completion_service()
+    if service_name == ChatServices.FAKE:
+        return _get_fake_chat_completion_service()
+    if service_name == ChatServices.POOL:
+        return _get_deployment_pool_service()
     raise ValueError(f'Unsupported service name: {service_name}')
 
 
@@ -94,6 +127,94 @@ def _get_openai_chat_completion_service() -> OpenAIChatCompletion:
     )
 
 
+def _get_fake_chat_completion_service() -> FakeChatCompletion:
+    """Return the offline fake chat completion service.
+
+    Returns:
+        FakeChatCompletion: Fake service configured from FAKE_MODEL_* variables.
+    """
+    seed = os.getenv('FAKE_MODEL_SEED')
+    return FakeChatCompletion(
+        service_id=service_id,
+        ai_model_id='fake',
+        latency_ms=float(os.getenv('FAKE_MODEL_LATENCY_MS', '300')),
+        jitter_ms=float(os.getenv('FAKE_MODEL_JITTER_MS', '50')),
+        distribution=LatencyDistribution(os.getenv('FAKE_MODEL_LATENCY_DISTRIBUTION', 'lognormal')),
+        failure_rate=float(os.getenv('FAKE_MODEL_FAILURE_RATE', '0')),
+        failure_status_code=int(os.getenv('FAKE_MODEL_FAILURE_STATUS', '500')),
+        prompt_tokens=int(os.getenv('FAKE_MODEL_PROMPT_TOKENS', '1500')),
+        completion_tokens=int(os.getenv('FAKE_MODEL_COMPLETION_TOKENS', '80')),
+        seed=int(seed) if seed else None,
+    )
+
+
+def _get_deployment_pool_service() -> DeploymentPool:
+    """Return a pool over the deployments listed in MODEL_DEPLOYMENTS.
+
+    MODEL_DEPLOYMENTS is a JSON list with one object per deployment, for example
+    [{"name": "east", "deployment": "gpt-4o", "endpoint": "https://east.openai.azure.com/"},
+    {"name": "local", "service": "fake", "failure_rate": 0.2, "failure_status_code": 429}].
+
+    Returns:
+        DeploymentPool: Pool routing to the least-loaded healthy deployment.
+
+    Raises:
+        ValueError: If MODEL_DEPLOYMENTS is missing or invalid.
+    """
+    try:
+        entries = json.loads(os.getenv('MODEL_DEPLOYMENTS', ''))
+    except json.JSONDecodeError as e:
+        raise ValueError(f'MODEL_DEPLOYMENTS must be a JSON list of deployments: {e}')
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('MODEL_DEPLOYMENTS must be a non-empty JSON list of deployments')
+
+    deployments = []
+    for index, entry in enumerate(entries):
+        entry = dict(entry)
+        name = entry.pop('name', f'deployment-{index}')
+        deployments.append((name, _get_deployment_service(name, entry)))
+    return DeploymentPool(
+        deployments,
+        service_id=service_id,
+        ai_model_id='pool',
+        cooldown_seconds=float(os.getenv('DEPLOYMENT_COOLDOWN_SECONDS', '10')),
+        max_cooldown_seconds=float(os.getenv('DEPLOYMENT_MAX_COOLDOWN_SECONDS', '120')),
+        hedge_percentile=float(os.getenv('HEDGE_PERCENTILE', '0.95')),
+        hedge_min_delay_ms=float(os.getenv('HEDGE_MIN_DELAY_MS', '50')),
+        hedge_max_rate=float(os.getenv('HEDGE_MAX_RATE', '0.05')),
+    )
+
+
+def _get_deployment_service(name: str, entry: dict[str, Any]) -> 'ChatCompletionClientBase':
+    """Return the chat completion service for one pool entry.
+
+    Settings left out of an Azure OpenAI entry fall back to the AZURE_OPENAI_* variables.
+    """
+    kind = ChatServices(entry.pop('service', ChatServices.AZURE_OPENAI.value))
+    if kind == ChatServices.FAKE:
+        return FakeChatCompletion(service_id=name, ai_model_id='fake', **entry)
+    if kind == ChatServices.OPENAI:
+        service = OpenAIChatCompletion(
+            service_id=name,
+            ai_model_id=entry.get('model') or os.getenv('OPENAI_MODEL_ID'),
+            api_key=entry.get('api_key') or os.getenv('OPENAI_API_KEY'),
+        )
+    elif kind == ChatServices.AZURE_OPENAI:
+        service = AzureChatCompletion(
+            service_id=name,
+            deployment_name=entry.get('deployment'),
+            endpoint=entry.get('endpoint'),
+            base_url=entry.get('base_url'),
+            api_key=entry.get('api_key'),
+            api_version=entry.get('api_version'),
+        )
+    else:
+        raise ValueError(f'Unsupported deployment service: {kind}')
+    # The pool fails over instead, so a throttled deployment must not retry in place
+    service.client = service.client.with_options(max_retries=0)
+    return service
+
+
 # endregion
 
 # region Response Format
@@ -106,142 +227,708 @@ class ResponseFormat(BaseModel):
     message: str
 
 
+class OutputFormat(str, Enum):
+    """How the model is asked to format its scenario answer."""
+
+    JSON_OBJECT = 'json_object'
+    """Any JSON object; the schema is only described in the prompt."""
+    JSON_SCHEMA = 'json_schema'
+    """Strict structured output constrained to the TurnScenarioModel schema."""
+
+
+SCENARIO_SCHEMA = strict_json_schema(TurnScenarioModel)
+
+RESPONSE_FORMATS = {
+    OutputFormat.JSON_OBJECT: {"type": "json_object"},
+    OutputFormat.JSON_SCHEMA: {
+        "type": "json_schema",
+        "json_schema": {"name": "scenario", "strict": True, "schema": SCENARIO_SCHEMA},
+    },
+}
+
+PROMPT_PATH = Path(__file__).parent / "data" / "prompts" / "prompt.md"
+
+DEFAULT_PROMPT = "You are a wargaming assistant."
+
+REPAIR_PROMPT = "You repair JSON so that it matches a JSON schema. Reply with the corrected JSON object only."
+
+
+def build_system_prompt(prompt: str) -> str:
+    """Return the system message: the prompt followed by the scenario schema.
+
+    The result only changes when the prompt file does, so every request
+    starts with the same bytes and provider-side prompt caching can reuse it.
+    """
+    return f"{prompt.rstrip()}\n\n```json\n{json.dumps(SCENARIO_SCHEMA, indent=2)}\n```\n"
+
+
+def parse_scenario(content: str) -> TurnScenarioModel:
+    """Parse and validate a scenario answer, tolerating a Markdown code fence around it.
+
+    A lone scenario without the engagements list is read as a one-engagement turn.
+
+    Raises:
+        ValidationError: If the answer is not valid JSON or does not match the schema.
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    return TurnScenarioModel.model_validate_json(text)
+
+
+# endregion
+
+# region Context Management
+
+
+class ContextMode(str, Enum):
+    """How much prior conversation process_image sends to the model."""
+
+    FULL = 'full'
+    """Keep every prior image and answer in the session history."""
+    COMPACT = 'compact'
+    """Replace prior images with scenario summaries and cap the number of turns."""
+    ONE_SHOT = 'one_shot'
+    """Use a fresh context for each call and retain nothing."""
+    GAME_STATE = 'game_state'
+    """Use a fresh context for each call, with a summary of the session's game state instead of prior turns."""
+
+    @property
+    def keeps_history(self) -> bool:
+        """Whether prior turns are sent from the session's chat history."""
+        return self in (ContextMode.FULL, ContextMode.COMPACT)
+
+
+def summarize_scenario(scenario: ScenarioModel) -> str:
+    """Return a one-line text summary of an identified scenario."""
+    return (
+        f"firing {scenario.firing.pose.value} {scenario.firing.weapon.value}, "
+        f"target {scenario.target.pose.value} {scenario.target.weapon.value}, "
+        f"distance {scenario.distance.value} {scenario.distance.unit}"
+        f"{' (estimated)' if scenario.distance.estimated else ''}"
+    )
+
+
+def summarize_turn(turn: TurnScenarioModel) -> str:
+    """Return a one-line text summary of every engagement in a turn."""
+    return "; ".join(summarize_scenario(scenario) for scenario in turn.engagements)
+
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+"""Receives human-readable progress updates while an image is processed."""
+
+
 # endregion
 
 # region Semantic Kernel Wargaming Agent
 
 
+@dataclass
+class PromptCacheStats:
+    """Cumulative token usage reported by the model, including prompt-cache hits."""
+    requests: int
+    cache_hits: int
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache_hits / self.requests if self.requests else 0.0
+
+
 class SemanticKernelWargamingAgent:
     """Wraps Semantic Kernel-based agents to handle wargaming tasks."""
 
     SUPPORTED_CONTENT_TYPES = ['text', 'text/plain', 'image']
 
-    def __init__(self):
+    def __init__(
+        self,
+        session_store: SessionStore | None = None,
+        context_mode: ContextMode | None = None,
+        max_history_turns: int | None = None,
+        result_cache: ResultCache | None = None,
+        image_preprocessor: ImagePreprocessor | None = None,
+    ):
         # Configure the chat completion service
-        # Uses Azure OpenAI by default. Change to ChatServices.OPENAI for OpenAI service.
-        chat_service = get_chat_completion_service(ChatServices.AZURE_OPENAI)
+        # Uses Azure OpenAI by default. Set CHAT_SERVICE=openai for OpenAI, or fake to run offline.
+        chat_service = get_chat_completion_service(
+            ChatServices(os.getenv('CHAT_SERVICE', ChatServices.AZURE_OPENAI.value))
+        )
 
         # Build the kernel
         self.kernel = Kernel()
         self.kernel.add_service(chat_service)
 
         # Add plugins
-        self.kernel.add_plugin(TurnManagerPlugin(), "TurnManager")
+        self.turn_manager = TurnManagerPlugin(
+            distance_tolerance_cm=float(os.getenv('DISTANCE_TOLERANCE_CM', '10')),
+        )
+        self.kernel.add_plugin(self.turn_manager, "TurnManager")
         
-        # Get the calculate_outcome function
-        self.calculate_outcome_function = self.kernel.get_function("TurnManager", "calculate_outcome")
+        # Get the function resolving every engagement of a turn in one pass
+        self.calculate_outcomes_function = self.kernel.get_function("TurnManager", "calculate_outcomes")
+
+        # Load the system prompt once; edits to the file are picked up without a restart
+        self.prompt_file = PromptFile(
+            PROMPT_PATH,
+            fallback=DEFAULT_PROMPT,
+            check_interval_seconds=float(os.getenv('PROMPT_RELOAD_INTERVAL_SECONDS', '1')),
+        )
+        self._system_prompt_source: str | None = None
+        self._system_prompt = ""
+
+        # Token usage reported by the model, for prompt-cache hit rates
+        self._usage_requests = 0
+        self._usage_cache_hits = 0
+        self._usage_prompt_tokens = 0
+        self._usage_cached_tokens = 0
+        self._usage_completion_tokens = 0
+
+        # Store session histories, bounded so long-running servers stay flat
+        self.session_store = session_store or InMemorySessionStore(
+            max_entries=int(os.getenv('SESSION_MAX_ENTRIES', '256')),
+            ttl_seconds=float(os.getenv('SESSION_TTL_SECONDS', '3600')),
+            max_bytes=int(os.getenv('SESSION_MAX_BYTES', str(256 * 1024 * 1024))),
+        )
+
+        # Default context handling for process_image calls
+        self.context_mode = context_mode or ContextMode(os.getenv('CONTEXT_MODE', ContextMode.COMPACT.value))
+        self.max_history_turns = (
+            max_history_turns if max_history_turns is not None else int(os.getenv('HISTORY_MAX_TURNS', '5'))
+        )
 
-        # Load the system prompt
-        self.system_prompt = self._load_system_prompt()
+        # Per-session units, casualties and turn number, updated from every result
+        self.game_states = GameStateStore(
+            max_entries=int(os.getenv('SESSION_MAX_ENTRIES', '256')),
+            ttl_seconds=float(os.getenv('SESSION_TTL_SECONDS', '3600')),
+            match_radius=int(os.getenv('GAME_STATE_MATCH_RADIUS_PX', '100')),
+        )
 
-        # Store session histories
-        self.session_histories: dict[str, ChatHistory] = {}
+        # Cache of parsed scenarios for repeated uploads of the same image
+        self.result_cache = result_cache
+        cache_max_entries = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1024'))
+        if self.result_cache is None and cache_max_entries > 0:
+            self.result_cache = ResultCache(
+                max_entries=cache_max_entries,
+                db_path=os.getenv('RESULT_CACHE_PATH') or None,
+            )
 
-    def _load_system_prompt(self) -> str:
-        """Load the system prompt from file."""
-        prompt_path = Path(__file__).parent / "data" / "prompts" / "prompt.md"
-        try:
-            return prompt_path.read_text(encoding="utf-8")
-        except FileNotFoundError:
-            logger.error(f"System prompt file not found: {prompt_path}")
-            return "You are a wargaming assistant."
+        # Shrinks uploads before they are base64-encoded for the model
+        self.image_preprocessor = image_preprocessor or ImagePreprocessor(
+            max_edge=int(os.getenv('IMAGE_MAX_EDGE', '1536')),
+            quality=int(os.getenv('IMAGE_QUALITY', '85')),
+            strip_exif=os.getenv('IMAGE_STRIP_EXIF', 'true').lower() == 'true',
+            # Crops to the marker buttons when both are found, else sends the whole image
+            button_detector=ButtonDetector() if os.getenv('BUTTON_CROP', 'true').lower() == 'true' else None,
+            crop_padding=float(os.getenv('BUTTON_CROP_PADDING', '1.5')),
+        )
 
-    async def process_image(self, image_bytes: bytes, user_input: str = "", session_id: str = "default") -> CombatResult:
-        """Process an image to identify toy soldiers and calculate wargame outcome.
+        # Caps and paces model-bound work to the deployment's quota, queueing a bounded backlog
+        self.admission = AdmissionController(
+            max_concurrency=int(os.getenv('ADMISSION_MAX_CONCURRENCY', '8')),
+            requests_per_minute=float(os.getenv('MODEL_REQUESTS_PER_MINUTE', '0')),
+            tokens_per_minute=float(os.getenv('MODEL_TOKENS_PER_MINUTE', '0')),
+            tokens_per_request=float(os.getenv('ADMISSION_TOKENS_PER_REQUEST', '2000')),
+            max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '32')),
+            queue_timeout_seconds=float(os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', '30')),
+        )
+
+        # Coalesces concurrent model calls for the same image and text, sharing the scenario
+        # and, for a game state turn, the result it was recorded with
+        self.single_flight: SingleFlight[tuple[TurnScenarioModel, CombatResult | None]] = SingleFlight()
+
+        # Maximum number of batch images processed at the same time
+        self.batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
+        # Answer format, output budget and whether one text-only repair call is allowed
+        # The budget covers several engagements of roughly 100 tokens each
+        self.output_format = OutputFormat(os.getenv('OUTPUT_FORMAT', OutputFormat.JSON_OBJECT.value))
+        self.max_output_tokens = int(os.getenv('MODEL_MAX_TOKENS', '800'))
+        self.repair_responses = os.getenv('RESPONSE_REPAIR', 'true').lower() == 'true'
+        # Default for process_image calls; only a deployment pool has another deployment to hedge to
+        self.hedge_requests = os.getenv('MODEL_HEDGING', 'false').lower() == 'true'
+        if self.hedge_requests and not isinstance(self.kernel.get_service("default"), DeploymentPool):
+            logger.warning("MODEL_HEDGING needs CHAT_SERVICE=pool with two or more deployments")
+
+    async def warm_up(self) -> None:
+        """Open the model connection ahead of the first request.
+
+        Any request to the endpoint is enough to complete the TLS handshake and
+        populate the HTTP connection pool, so failures here are only logged.
+        """
+        for chat_service in self._chat_services():
+            client = getattr(chat_service, "client", None)
+            if client is None:
+                continue
+            try:
+                await client.models.list()
+                logger.info(f"Chat completion service {chat_service.service_id} warmed up")
+            except Exception as e:
+                logger.warning(f"Chat completion warm-up request failed: {e}")
+
+    async def close(self) -> None:
+        """Release the chat completion service HTTP connections."""
+        for chat_service in self._chat_services():
+            client = getattr(chat_service, "client", None)
+            if client is not None:
+                await client.close()
+        if self.result_cache:
+            self.result_cache.close()
+        logger.info("Agent closed")
+
+    def _chat_services(self) -> list['ChatCompletionClientBase']:
+        """Return the chat completion services behind the kernel's default service."""
+        chat_service = self.kernel.get_service("default")
+        return chat_service.services if isinstance(chat_service, DeploymentPool) else [chat_service]
+
+    def deployment_stats(self) -> list[DeploymentStats] | None:
+        """Return per-deployment load and health when a deployment pool is in use."""
+        chat_service = self.kernel.get_service("default")
+        return chat_service.stats() if isinstance(chat_service, DeploymentPool) else None
+
+    def hedge_stats(self) -> HedgeStats | None:
+        """Return hedged call counters when a deployment pool is in use."""
+        chat_service = self.kernel.get_service("default")
+        return chat_service.hedge_stats() if isinstance(chat_service, DeploymentPool) else None
+
+    @property
+    def system_prompt(self) -> str:
+        """The system message, rebuilt only when the prompt file changes."""
+        prompt = self.prompt_file.text
+        if prompt is not self._system_prompt_source:
+            self._system_prompt = build_system_prompt(prompt)
+            self._system_prompt_source = prompt
+        return self._system_prompt
+
+    def prompt_cache_stats(self) -> PromptCacheStats:
+        """Return cumulative token usage and prompt-cache hits."""
+        return PromptCacheStats(
+            requests=self._usage_requests,
+            cache_hits=self._usage_cache_hits,
+            prompt_tokens=self._usage_prompt_tokens,
+            cached_tokens=self._usage_cached_tokens,
+            completion_tokens=self._usage_completion_tokens,
+        )
+
+    def _record_usage(self, metadata: dict[str, Any] | None) -> None:
+        """Count the token usage and prompt-cache hit reported with a response."""
+        usage = (metadata or {}).get("usage")
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt_tokens = usage.prompt_tokens or 0
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        completion_tokens = usage.completion_tokens or 0
+
+        self.admission.record_tokens(prompt_tokens + completion_tokens)
+        self._usage_requests += 1
+        self._usage_prompt_tokens += prompt_tokens
+        self._usage_cached_tokens += cached_tokens
+        self._usage_completion_tokens += completion_tokens
+        if cached_tokens:
+            self._usage_cache_hits += 1
+
+        PROMPT_CACHE_REQUESTS.inc(result="hit" if cached_tokens else "miss")
+        MODEL_TOKENS.inc(prompt_tokens - cached_tokens, kind="prompt")
+        MODEL_TOKENS.inc(cached_tokens, kind="cached_prompt")
+        MODEL_TOKENS.inc(completion_tokens, kind="completion")
+
+    async def process_image(
+        self,
+        image_bytes: bytes,
+        user_input: str = "",
+        session_id: str = "default",
+        context_mode: ContextMode | None = None,
+        progress: ProgressCallback | None = None,
+        hedge: bool | None = None,
+    ) -> CombatResult:
+        """Process an image to identify toy soldiers and calculate wargame outcomes.
+
+        Every engagement on the table is identified by one model call and
+        resolved in one batched pass.
         
         Args:
             image_bytes: The image data
             user_input: Optional user input (e.g., distance information)
             session_id: Session identifier
+            context_mode: How much prior conversation to send; defaults to the agent's mode
+            progress: Optional callback for stage updates; enables the streaming model call
+            hedge: Send a slow vision call to a second deployment as well; defaults to MODEL_HEDGING.
+                Streaming calls are not hedged.
             
         Returns:
-            CombatResult: The scenario and outcome
+            CombatResult: The first engagement's scenario and outcome, plus every engagement
         """
-        # Get or create chat history for this session
-        if session_id not in self.session_histories:
-            self.session_histories[session_id] = ChatHistory()
-            self.session_histories[session_id].add_system_message(self.system_prompt)
+        context_mode = context_mode or self.context_mode
+        hedge = self.hedge_requests if hedge is None else hedge
+
+        async def report(message: str) -> None:
+            if progress is not None:
+                await progress(message)
+
+        await report(f"Image received ({len(image_bytes)} bytes)")
+
+        # Identical uploads reuse the cached scenario but still roll fresh dice. Answers given with
+        # session history or game state belong to that session; only one-shot answers are shared
+        context = "" if context_mode == ContextMode.ONE_SHOT else f"{context_mode.value}:{session_id}"
+        key = cache_key(image_bytes, user_input, context)
+        # A game advances once per turn, and the same image on a later turn meets another state,
+        # so game state turns are never served from the cache
+        game_state = context_mode == ContextMode.GAME_STATE
+        result_cache = None if game_state else self.result_cache
+        turn = await result_cache.get(key) if result_cache else None
+        result = None
+        if turn is None:
+            await report("Analyzing image")
+
+            async def identify() -> tuple[TurnScenarioModel, CombatResult | None]:
+                # Cache hits and coalesced callers never reach admission control
+                async with self.admission.admit():
+                    identified = await self._identify_scenario(
+                        image_bytes, user_input, session_id, context_mode, stream=progress is not None, hedge=hedge
+                    )
+                if result_cache:
+                    await result_cache.put(key, identified)
+                if not game_state:
+                    return identified, None
+                # The turn is rolled and recorded once; identical uploads coalesced onto it share its dice
+                played = await self._play_turn(identified)
+                self.game_states.get(session_id).apply(played)
+                return identified, played
+
+            # Concurrent identical uploads share one model call
+            turn, result = await self.single_flight.do(key, identify)
+        else:
+            logger.info(f"Result cache hit for image {key[:12]}")
+        await report(f"Scenario identified: {summarize_turn(turn)}")
+
+        if result is None:
+            result = await self._play_turn(turn)
+        outcomes = [engagement.outcome for engagement in result.engagements]
+        if len(outcomes) == 1:
+            await report(
+                f"Outcome rolled: {'hit' if outcomes[0].hit_or_miss else 'miss'} "
+                f"(rolled {outcomes[0].rolled_dice})"
+            )
+        else:
+            hits = sum(outcome.hit_or_miss for outcome in outcomes)
+            await report(f"Outcomes rolled: {hits} of {len(outcomes)} shots hit")
+        return result
+
+    async def process_batch(
+        self,
+        images: list[bytes],
+        user_input: str = "",
+        filenames: list[str | None] | None = None,
+        concurrency: int | None = None,
+        progress: ProgressCallback | None = None,
+    ) -> BatchCombatResult:
+        """Process several images concurrently, returning results in input order.
+
+        Each image is analysed in its own one-shot context, so a failing image
+        only produces an error entry for itself.
+
+        Args:
+            images: The image data, one entry per image
+            user_input: Optional user input applied to every image
+            filenames: Optional file names reported back with each result
+            concurrency: Maximum images in flight; defaults to the agent's batch concurrency
+            progress: Optional callback reporting each completed image
+            
+        Returns:
+            BatchCombatResult: One result or error per image
+        """
+        semaphore = asyncio.Semaphore(max(concurrency or self.batch_concurrency, 1))
+        filenames = filenames or [None] * len(images)
+        completed = 0
+
+        async def process_one(index: int, image_bytes: bytes) -> BatchItemResult:
+            nonlocal completed
+            async with semaphore:
+                try:
+                    result = await self.process_image(
+                        image_bytes, user_input, context_mode=ContextMode.ONE_SHOT
+                    )
+                    item = BatchItemResult(index=index, filename=filenames[index], result=result)
+                except Exception as e:
+                    count_error(e)
+                    logger.error(f"Batch image {index} failed: {e}")
+                    item = BatchItemResult(index=index, filename=filenames[index], error=str(e))
+            completed += 1
+            if progress is not None:
+                await progress(f"Resolved {completed}/{len(images)} images")
+            return item
+
+        results = await asyncio.gather(*(process_one(i, image) for i, image in enumerate(images)))
+        return BatchCombatResult(results=list(results))
+
+    async def _identify_scenario(
+        self,
+        image_bytes: bytes,
+        user_input: str,
+        session_id: str,
+        context_mode: ContextMode,
+        stream: bool = False,
+        hedge: bool = False,
+    ) -> TurnScenarioModel:
+        """Ask the vision model for every engagement in an image and validate them."""
 
-        history = self.session_histories[session_id]
+        # Get or create chat history for this session
+        history = None
+        if context_mode.keeps_history:
+            history = self.session_store.get(session_id)
+        system_prompt = self.system_prompt
+        if history is None:
+            history = ChatHistory()
+            history.add_system_message(system_prompt)
+        elif history.messages[0].content != system_prompt:
+            # Move sessions onto a reloaded prompt so they share the cached prefix
+            history.messages[0] = ChatMessageContent(role=AuthorRole.SYSTEM, content=system_prompt)
 
         # Create the user message with image and text
-        user_message_text = user_input if user_input else "Identify the firing and target toy soldiers in this picture, then calculate the outcome of the wargame scenario. Return the scenario and outcome as JSON"
-        
-        import base64
-        
+        user_message_text = user_input if user_input else "Identify every pair of firing and target toy soldiers in this picture, then calculate the outcome of each engagement. Return the engagements as JSON"
+        if context_mode == ContextMode.GAME_STATE:
+            game_state = self.game_states.get(session_id)
+            if game_state.turn:
+                # A fixed-size summary replaces the replayed turns
+                user_message_text = (
+                    f"Game state so far, for context only:\n{game_state.summary()}\n\n{user_message_text}"
+                )
+
+        # Downscale and re-encode off the event loop before encoding
+        with time_stage("image_preprocess"):
+            image = await self.image_preprocessor.process_async(image_bytes)
+
+        with time_stage("base64_encode"):
+            image_data = base64.b64encode(image.data).decode('utf-8')
+
         message_items = [
             TextContent(text=user_message_text),
-            ImageContent(data=base64.b64encode(image_bytes).decode('utf-8'), data_format="base64", mime_type="image/jpeg")
+            ImageContent(data=image_data, data_format="base64", mime_type=image.mime_type)
         ]
         
         history.add_user_message(message_items)
 
-        # Configure execution settings with JSON output format
-        execution_settings = OpenAIChatPromptExecutionSettings(
-            temperature=0.1,
-            max_tokens=4000,
-            response_format={"type": "json_object"}
-        )
+        execution_settings = self._execution_settings()
 
         # Get chat completion service
         chat_service = self.kernel.get_service("default")
 
         # Get the AI response for scenario identification
-        response = await chat_service.get_chat_message_content(
-            chat_history=history,
-            settings=execution_settings,
-            kernel=self.kernel
-        )
+        user_message = history.messages[-1]
+        try:
+            with time_stage("model_call"):
+                if stream:
+                    # Streaming lets the first tokens arrive before the full answer
+                    chunks = []
+                    async for chunk in chat_service.get_streaming_chat_message_content(
+                        chat_history=history,
+                        settings=execution_settings,
+                        kernel=self.kernel
+                    ):
+                        if chunk is None:
+                            continue
+                        if chunk.content:
+                            chunks.append(chunk.content)
+                        # Usage arrives with the final chunk
+                        self._record_usage(chunk.metadata)
+                    response_content = "".join(chunks)
+                else:
+                    # A hedged call is also sent to another deployment if it is slow, and the first answer wins
+                    with hedging_allowed() if hedge else nullcontext():
+                        response = await chat_service.get_chat_message_content(
+                            chat_history=history,
+                            settings=execution_settings,
+                            kernel=self.kernel
+                        )
+                    self._record_usage(response.metadata)
+                    response_content = response.content or ""
+        except BaseException:
+            # The store hands out the live history: keep the unanswered image out of later turns
+            history.messages = [message for message in history.messages if message is not user_message]
+            raise
 
         # Add response to history
-        history.add_assistant_message(response.content or "")
+        history.add_assistant_message(response_content)
 
-        logger.info(f"Assistant response: {response}")
+        logger.info(f"Assistant response: {response_content}")
 
-        # Parse the response to extract scenario
+        # Parse the response to extract the engagements
         try:
-            import json
-            
-            response_content = response.content or ""
-            logger.info(f"Raw response content: {response_content}")
-            scenario_data = json.loads(response_content)
-            logger.info(f"Parsed scenario data: {scenario_data}")
-            scenario = ScenarioModel.model_validate(scenario_data)
-            logger.info(f"Validated scenario: {scenario}")
-            
-            # Calculate outcome using the TurnManager plugin
-            outcome_result = await self.kernel.invoke(
-                self.calculate_outcome_function,
-                scenario=scenario
+            with time_stage("json_parse"):
+                turn = parse_scenario(response_content)
+        except Exception as e:
+            logger.warning(f"Invalid scenario answer: {e}")
+            turn = await self._repair_scenario(response_content, e) if self.repair_responses else None
+            if turn is None:
+                self._discard_failed_turn(session_id, history, context_mode)
+                raise ValueError(f"Failed to process image: {e}")
+            # Keep the corrected answer rather than the invalid one
+            history.messages[-1] = ChatMessageContent(
+                role=AuthorRole.ASSISTANT,
+                content=turn.model_dump_json(exclude_none=True),
             )
+        logger.info(f"Validated {len(turn.engagements)} engagements: {turn}")
+
+        # Report positions in the uploaded image rather than the cropped, resized one sent
+        for scenario in turn.engagements:
+            for soldier in (scenario.firing, scenario.target):
+                if soldier.coordinates is not None:
+                    x, y = image.to_original(soldier.coordinates.x, soldier.coordinates.y)
+                    soldier.coordinates = Coordinates(x=x, y=y)
+                if soldier.height is not None:
+                    soldier.height = round(soldier.height / image.scale)
+
+        # Measure the distances locally, falling back to the model's estimates
+        resolved = []
+        for scenario in turn.engagements:
+            try:
+                resolved.append(self.turn_manager.resolve_distance(scenario))
+            except ValueError as e:
+                # An engagement without any distance does not sink the others
+                logger.warning(f"Engagement dropped: {e}")
+        if not resolved:
+            self._discard_failed_turn(session_id, history, context_mode)
+            raise ValueError("Failed to process image: no engagement has a distance")
+        turn = TurnScenarioModel(engagements=resolved)
+
+        if context_mode == ContextMode.COMPACT:
+            self._compact_history(history, turn)
+        self._save_history(session_id, history, context_mode)
+        return turn
+
+    def _execution_settings(self) -> OpenAIChatPromptExecutionSettings:
+        """Return the settings for a scenario call in the configured output format."""
+        return OpenAIChatPromptExecutionSettings(
+            temperature=0.1,
+            max_tokens=self.max_output_tokens,
+            response_format=RESPONSE_FORMATS[self.output_format],
+        )
+
+    async def _repair_scenario(self, response_content: str, error: Exception) -> TurnScenarioModel | None:
+        """Ask the model once to fix an invalid answer, without sending the image again.
+
+        Returns:
+            TurnScenarioModel | None: The repaired engagements, or None if the repair failed too.
+        """
+        history = ChatHistory()
+        history.add_system_message(REPAIR_PROMPT)
+        history.add_user_message(
+            f"Schema:\n{json.dumps(SCENARIO_SCHEMA)}\n\n"
+            f"Invalid JSON:\n{response_content}\n\n"
+            f"Errors:\n{error}"
+        )
+        chat_service = self.kernel.get_service("default")
+        try:
+            with time_stage("repair_call"):
+                response = await chat_service.get_chat_message_content(
+                    chat_history=history,
+                    settings=self._execution_settings(),
+                    kernel=self.kernel
+                )
+            self._record_usage(response.metadata)
+            with time_stage("json_parse"):
+                turn = parse_scenario(response.content or "")
+        except Exception as e:
+            REPAIRS.inc(result="failed")
+            logger.error(f"Repair of the scenario answer failed: {e}")
+            return None
+        REPAIRS.inc(result="repaired")
+        logger.info("Repaired the scenario answer with a text-only call")
+        return turn
+
+    async def _play_turn(self, turn: TurnScenarioModel) -> CombatResult:
+        """Roll every engagement of a turn and return the combat result."""
+        outcomes = await self._calculate_outcomes(turn)
+        engagements = [
+            EngagementResult(scenario=scenario, outcome=outcome)
+            for scenario, outcome in zip(turn.engagements, outcomes)
+        ]
+        return CombatResult(
+            scenario=engagements[0].scenario,
+            outcome=engagements[0].outcome,
+            engagements=engagements,
+        )
+
+    async def _calculate_outcomes(self, turn: TurnScenarioModel) -> list[ScenarioOutcome]:
+        """Roll the outcomes of every engagement with the TurnManager plugin."""
+        try:
+            # Calculate all outcomes in one TurnManager call
+            with time_stage("outcome_calculation"):
+                outcome_result = await self.kernel.invoke(
+                    self.calculate_outcomes_function,
+                    turn=turn
+                )
             
             if hasattr(outcome_result, 'value'):
-                outcome = outcome_result.value
-            else:
-                outcome = outcome_result
-                
-            return CombatResult(scenario=scenario, outcome=outcome)
+                return outcome_result.value
+            return outcome_result
                 
         except Exception as e:
-            logger.error(f"Error parsing response: {e}")
-            logger.error(f"Response content: {response_content}")
+            logger.error(f"Error calculating outcome: {e}")
             raise ValueError(f"Failed to process image: {e}")
 
-    async def invoke(self, user_input: str, session_id: str, image_bytes: bytes = None) -> dict[str, Any]:
+    def _compact_history(self, history: ChatHistory, turn: TurnScenarioModel) -> None:
+        """Replace the latest image with its engagement summary and cap the turn count.
+
+        Every earlier turn was compacted when it completed, so only the last
+        user message can still hold an image.
+        """
+        user_message = history.messages[-2]
+        user_message.items = [
+            item if not isinstance(item, ImageContent)
+            else TextContent(text=f"[Image analysed: {summarize_turn(turn)}]")
+            for item in user_message.items
+        ]
+        history.messages[-1] = ChatMessageContent(
+            role=AuthorRole.ASSISTANT,
+            content=turn.model_dump_json(exclude_none=True),
+        )
+
+        # Keep the system prompt plus the most recent user/assistant pairs
+        if self.max_history_turns > 0:
+            turns = history.messages[1:]
+            if len(turns) > self.max_history_turns * 2:
+                history.messages = history.messages[:1] + turns[-self.max_history_turns * 2:]
+
+    def _discard_failed_turn(self, session_id: str, history: ChatHistory, context_mode: ContextMode) -> None:
+        """Store a history whose last turn produced no scenario."""
+        if context_mode == ContextMode.COMPACT:
+            # Do not carry an unusable image turn into later requests
+            del history.messages[-2:]
+        self._save_history(session_id, history, context_mode)
+
+    def _save_history(self, session_id: str, history: ChatHistory, context_mode: ContextMode) -> None:
+        """Store a session history if the context mode replays it."""
+        if context_mode.keeps_history:
+            self.session_store.put(session_id, history)
+
+    async def invoke(
+        self,
+        user_input: str,
+        session_id: str,
+        image_bytes: bytes = None,
+        progress: ProgressCallback | None = None,
+    ) -> dict[str, Any]:
         """Handle synchronous tasks (like tasks/send).
 
         Args:
             user_input (str): User input message.
             session_id (str): Unique identifier for the session.
             image_bytes (bytes): Optional image data.
+            progress (ProgressCallback): Optional callback for stage updates.
 
         Returns:
             dict: A dictionary containing the content, task completion status,
             and user input requirement.
+
+        Raises:
+            AdmissionRejected: If the model is too busy to take the request.
         """
         try:
             if image_bytes:
-                result = await self.process_image(image_bytes, user_input, session_id)
+                result = await self.process_image(image_bytes, user_input, session_id, progress=progress)
                 return {
                     'is_task_complete': True,
                     'require_user_input': False,
@@ -254,7 +941,11 @@ class SemanticKernelWargamingAgent:
                     'require_user_input': True,
                     'content': 'Please provide an image of toy soldiers for wargame analysis.',
                 }
+        except AdmissionRejected:
+            # The caller turns this into a rejected task with a retry hint
+            raise
         except Exception as e:
+            count_error(e)
             logger.error(f"Error processing request: {e}")
             return {
                 'is_task_complete': False,
@@ -262,6 +953,39 @@ class SemanticKernelWargamingAgent:
                 'content': f'Error processing request: {str(e)}',
             }
 
+    async def invoke_batch(
+        self,
+        user_input: str,
+        images: list[bytes],
+        progress: ProgressCallback | None = None,
+    ) -> dict[str, Any]:
+        """Handle a task carrying several images.
+
+        Args:
+            user_input (str): User input message, applied to every image.
+            images (list[bytes]): Image data, one entry per image.
+            progress (ProgressCallback): Optional callback for per-image updates.
+
+        Returns:
+            dict: A dictionary containing the content, task completion status,
+            and user input requirement.
+        """
+        try:
+            result = await self.process_batch(images, user_input, progress=progress)
+            return {
+                'is_task_complete': True,
+                'require_user_input': False,
+                'content': result.model_dump_json(by_alias=True),
+            }
+        except Exception as e:
+            count_error(e)
+            logger.error(f"Error processing batch request: {e}")
+            return {
+                'is_task_complete': False,
+                'require_user_input': True,
+                'content': f'Error processing request: {str(e)}',
+            }
+
 
 
 
@@ -1,12 +1,18 @@
 """Agent executor for the wargaming agent using A2A protocol."""
 
+import asyncio
+import base64
 import logging
 from io import BytesIO
 
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events.event_queue import EventQueue
 from a2a.types import (
+    FilePart,
+    FileWithBytes,
+    Message,
     TaskArtifactUpdateEvent,
+    TaskNotCancelableError,
     TaskState,
     TaskStatus,
     TaskStatusUpdateEvent,
@@ -16,17 +22,49 @@ from a2a.utils import (
     new_task,
     new_text_artifact,
 )
+from a2a.utils.errors import ServerError
+from admission import AdmissionRejected
 from agent import SemanticKernelWargamingAgent
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Task states from which a task can no longer be cancelled
+TERMINAL_STATES = {
+    TaskState.completed,
+    TaskState.canceled,
+    TaskState.failed,
+    TaskState.rejected,
+}
+
+
+def extract_images(message: Message | None) -> list[bytes]:
+    """Return the decoded bytes of every inline image file part in a message."""
+    images = []
+    if message is None or not message.parts:
+        return images
+    for part in message.parts:
+        part = part.root
+        if isinstance(part, FilePart) and isinstance(part.file, FileWithBytes):
+            if part.file.mimeType and not part.file.mimeType.startswith('image/'):
+                continue
+            images.append(base64.b64decode(part.file.bytes))
+    return images
+
 
 class WargamingAgentExecutor(AgentExecutor):
     """Wargaming Agent Executor for A2A protocol."""
 
-    def __init__(self):
-        self.agent = SemanticKernelWargamingAgent()
+    # Characters per artifact chunk when streaming the result
+    ARTIFACT_CHUNK_SIZE = 512
+
+    def __init__(self, agent: SemanticKernelWargamingAgent | None = None, streaming: bool = True):
+        # Share the application-wide agent when one is provided
+        self.agent = agent or SemanticKernelWargamingAgent()
+        self.streaming = streaming
+        # In-flight agent work, its event queue and an event set once cancel() has
+        # reported the task canceled, by task id
+        self._running: dict[str, tuple[asyncio.Future, EventQueue, asyncio.Event]] = {}
 
     async def execute(
         self,
@@ -41,19 +79,55 @@ class WargamingAgentExecutor(AgentExecutor):
             await event_queue.enqueue_event(task)
 
         # Check if there are any image attachments
-        image_bytes = None
-        if context.message and context.message.parts:
-            for part in context.message.parts:
-                if hasattr(part, 'type') and part.type == 'image':
-                    # Extract image bytes
-                    if hasattr(part, 'data'):
-                        image_bytes = part.data
-                    elif hasattr(part, 'content'):
-                        image_bytes = part.content
-                    break
-
-        # Process the request directly (no streaming)
-        result = await self.agent.invoke(query, task.contextId, image_bytes)
+        images = extract_images(context.message)
+        image_bytes = images[0] if images else None
+
+        async def report_progress(message: str) -> None:
+            await event_queue.enqueue_event(
+                TaskStatusUpdateEvent(
+                    status=TaskStatus(
+                        state=TaskState.working,
+                        message=new_agent_text_message(
+                            message,
+                            task.contextId,
+                            task.id,
+                        ),
+                    ),
+                    final=False,
+                    contextId=task.contextId,
+                    taskId=task.id,
+                )
+            )
+
+        # In streaming mode each processing stage is reported as it completes
+        progress = report_progress if self.streaming else None
+        if len(images) > 1:
+            # Several images in one message are resolved as a batch
+            work = self.agent.invoke_batch(query, images, progress=progress)
+        else:
+            work = self.agent.invoke(query, task.contextId, image_bytes, progress=progress)
+
+        # Run the model-bound work as its own task so cancel() can abort it
+        running = asyncio.ensure_future(work)
+        canceled = asyncio.Event()
+        self._running[task.id] = (running, event_queue, canceled)
+        try:
+            result = await running
+        except asyncio.CancelledError:
+            logger.info(f"Task {task.id} cancelled")
+            if not running.cancelled():
+                running.cancel()
+            # cancel() takes the entry before aborting the work; then only the work was
+            # cancelled, and execute ends normally once the canceled status is queued
+            if task.id not in self._running:
+                await canceled.wait()
+                return
+            raise
+        except AdmissionRejected as e:
+            await self._enqueue_rejection(event_queue, task, e)
+            return
+        finally:
+            self._running.pop(task.id, None)
         
         require_input = result['require_user_input']
         is_done = result['is_task_complete']
@@ -76,30 +150,88 @@ class WargamingAgentExecutor(AgentExecutor):
                 )
             )
         elif is_done:
+            await self._enqueue_artifact(event_queue, task, text_content)
             await event_queue.enqueue_event(
-                TaskArtifactUpdateEvent(
-                    append=False,
+                TaskStatusUpdateEvent(
+                    status=TaskStatus(state=TaskState.completed),
+                    final=True,
                     contextId=task.contextId,
                     taskId=task.id,
-                    lastChunk=True,
-                    artifact=new_text_artifact(
-                        name='wargame_result',
-                        description='Result of wargame scenario analysis.',
-                        text=text_content,
-                    ),
                 )
             )
+
+    async def _enqueue_rejection(self, event_queue: EventQueue, task, error: AdmissionRejected) -> None:
+        """End the task as rejected, telling the client when to retry."""
+        message = new_agent_text_message(
+            f"{error}. Retry after {error.retry_after} seconds.",
+            task.contextId,
+            task.id,
+        )
+        message.metadata = {"retry_after_seconds": error.retry_after, "status_code": error.status_code}
+        await event_queue.enqueue_event(
+            TaskStatusUpdateEvent(
+                status=TaskStatus(state=TaskState.rejected, message=message),
+                final=True,
+                contextId=task.contextId,
+                taskId=task.id,
+            )
+        )
+
+    async def _enqueue_artifact(self, event_queue: EventQueue, task, text_content: str) -> None:
+        """Emit the result artifact, in appended chunks when streaming."""
+        chunk_size = self.ARTIFACT_CHUNK_SIZE if self.streaming else len(text_content)
+        chunks = [
+            text_content[i:i + chunk_size]
+            for i in range(0, len(text_content), max(chunk_size, 1))
+        ] or ['']
+        artifact_id = None
+        for index, chunk in enumerate(chunks):
+            artifact = new_text_artifact(
+                name='wargame_result',
+                description='Result of wargame scenario analysis.',
+                text=chunk,
+            )
+            # Every chunk must target the same artifact to be appended
+            if artifact_id is None:
+                artifact_id = artifact.artifactId
+            else:
+                artifact.artifactId = artifact_id
             await event_queue.enqueue_event(
-                TaskStatusUpdateEvent(
-                    status=TaskStatus(state=TaskState.completed),
-                    final=True,
+                TaskArtifactUpdateEvent(
+                    append=index > 0,
                     contextId=task.contextId,
                     taskId=task.id,
+                    lastChunk=index == len(chunks) - 1,
+                    artifact=artifact,
                 )
             )
 
     async def cancel(
         self, context: RequestContext, event_queue: EventQueue
     ) -> None:
-        """Cancel operation - not supported."""
-        raise Exception('cancel not supported')
\ No newline at end of file
+        """Abort the in-flight model work of a task and mark it canceled."""
+        task = context.current_task
+        task_id = context.task_id
+        if task and task.status.state in TERMINAL_STATES:
+            raise ServerError(error=TaskNotCancelableError())
+
+        running, task_queue, canceled = self._running.pop(task_id, (None, event_queue, None))
+        if running is not None and not running.done():
+            # Cancelling propagates into the model call and any queued batch items
+            running.cancel()
+            logger.info(f"Cancelled in-flight work for task {task_id}")
+
+        # The task's own queue also feeds any tapped queue, so streaming
+        # subscribers and the cancel caller both see the final status
+        try:
+            await task_queue.enqueue_event(
+                TaskStatusUpdateEvent(
+                    status=TaskStatus(state=TaskState.canceled),
+                    final=True,
+                    contextId=context.context_id,
+                    taskId=task_id,
+                )
+            )
+        finally:
+            if canceled is not None:
+                canceled.set()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Local stand-in for the Azure OpenAI chat completions endpoint.
+
+Answers every chat completion request with a valid scenario JSON derived from
+a hash of the request body, after a configurable simulated latency, so the
+real server can be benchmarked end to end without network access.
+"""
+
+import http.server
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# Answers come from the same generator as the in-process fake chat service
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fake_chat_completion import scenario_for_image  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+class FakeModelServer:
+    """Threaded HTTP server speaking enough of the chat completions API for the agent.
+
+    Args:
+        host: Interface to bind to.
+        port: Port to bind to; 0 picks a free port.
+        latency_ms: Mean simulated model latency.
+        jitter_ms: Standard deviation of the simulated latency.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 300, jitter_ms: float = 50):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._httpd = http.server.ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeModelServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _delay(self) -> float:
+        return max(random.gauss(self.latency_ms, self.jitter_ms), 0) / 1000
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                # Warm-up calls such as models.list only need a well-formed reply
+                self._send_json({"object": "list", "data": []})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("content-length", 0)))
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    self._send_json({"error": {"message": "not found"}}, status=404)
+                    return
+                request = json.loads(body or b"{}")
+                content = json.dumps(scenario_for_image(body))
+                time.sleep(server._delay())
+                if request.get("stream"):
+                    self._send_stream(request, content)
+                else:
+                    self._send_json(self._completion(request, content))
+
+            def _completion(self, request: dict, content: str) -> dict:
+                return {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 1000, "completion_tokens": 80, "total_tokens": 1080},
+                }
+
+            def _send_stream(self, request: dict, content: str) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+                for index, piece in enumerate(pieces):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model", "fake"),
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"role": "assistant", "content": piece} if index == 0 else {"content": piece},
+                            "finish_reason": "stop" if index == len(pieces) - 1 else None,
+                        }],
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            def _send_json(self, payload: dict, status: int = 200) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} - {format % args}")
+
+        return Handler
@@ -0,0 +1,313 @@
+"""Load-test harness for the combat pipeline.
+
+Starts a local fake model, launches the server under test as a subprocess
+pointed at it, drives it at a fixed concurrency with the sample images in
+Tests/, and writes latency percentiles, throughput, error rate and server
+memory growth as JSON so builds can be compared.
+
+Examples:
+    python benchmarks/run_benchmark.py --target combat --concurrency 16 --requests 400
+    python benchmarks/run_benchmark.py --target a2a --model-latency-ms 800 --output a2a.json
+    python benchmarks/run_benchmark.py --target mock --concurrency 32
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import click
+import httpx
+
+from fake_model_server import FakeModelServer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# One log line per request would distort the client-side timings
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+WEBAPI_DIR = Path(__file__).resolve().parent.parent
+TEST_IMAGES = sorted((WEBAPI_DIR / "Tests").glob("*.jpg"))
+
+
+def percentile(values: list[float], fraction: float) -> Optional[float]:
+    """Return the nearest-rank percentile of the values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """Return the resident set size of a process, where /proc is available."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_server(
+    target: str,
+    port: int,
+    model_url: Optional[str],
+    cache: bool,
+    model_latency_ms: float,
+    model_jitter_ms: float,
+) -> subprocess.Popen:
+    """Launch the server under test with its model pointed at the fake.
+
+    Without a model URL the server uses its in-process fake chat service. The
+    mock server has no model client, so it simulates the same latency itself.
+    """
+    env = {
+        **os.environ,
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        # Azure endpoints must be https; the base URL overrides it and may be plain http
+        "AZURE_OPENAI_ENDPOINT": "https://localhost/",
+        "AZURE_OPENAI_BASE_URL": f"{model_url}openai/deployments/benchmark" if model_url else "",
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        "AZURE_OPENAI_CHAT_DEPLOYMENT_NAME": "benchmark",
+        "AZURE_OPENAI_API_VERSION": "2024-12-01-preview",
+        "UPLOAD_ARCHIVE": "false",
+        "RESULT_CACHE_MAX_ENTRIES": os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1024") if cache else "0",
+        "RESULT_CACHE_PATH": "",
+        "MOCK_MODEL_LATENCY_MS": str(model_latency_ms),
+        "MOCK_MODEL_JITTER_MS": str(model_jitter_ms),
+    }
+    if model_url is None:
+        env.update({
+            "CHAT_SERVICE": "fake",
+            "FAKE_MODEL_LATENCY_MS": str(model_latency_ms),
+            "FAKE_MODEL_JITTER_MS": str(model_jitter_ms),
+            "FAKE_MODEL_LATENCY_DISTRIBUTION": "normal",
+        })
+    script = "mock_server.py" if target == "mock" else "__main__.py"
+    return subprocess.Popen(
+        [sys.executable, script],
+        cwd=WEBAPI_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get(f"{base_url}/")
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"Server at {base_url} did not become ready")
+
+
+def load_images(unique: bool, count: int) -> list[bytes]:
+    """Return one payload per request, cycling through the sample images.
+
+    With unique payloads, bytes appended after the JPEG end marker make every
+    upload hash differently (decoders ignore them), so caching and request
+    coalescing do not hide the model path.
+    """
+    samples = [path.read_bytes() for path in TEST_IMAGES]
+    payloads = []
+    for index in range(count):
+        image = samples[index % len(samples)]
+        payloads.append(image + uuid.uuid4().bytes if unique else image)
+    return payloads
+
+
+async def send_combat(client: httpx.AsyncClient, base_url: str, image: bytes) -> None:
+    response = await client.post(
+        f"{base_url}/api/combat",
+        files={"image": ("benchmark.jpg", image, "image/jpeg")},
+    )
+    response.raise_for_status()
+
+
+async def send_a2a(client: httpx.AsyncClient, base_url: str, image: bytes) -> None:
+    payload = {
+        "jsonrpc": "2.0",
+        "id": str(uuid.uuid4()),
+        "method": "message/send",
+        "params": {
+            "message": {
+                "role": "user",
+                "kind": "message",
+                "messageId": str(uuid.uuid4()),
+                "parts": [
+                    {"kind": "text", "text": "Resolve this shot."},
+                    {"kind": "file", "file": {
+                        "bytes": base64.b64encode(image).decode(),
+                        "mimeType": "image/jpeg",
+                        "name": "benchmark.jpg",
+                    }},
+                ],
+            }
+        },
+    }
+    response = await client.post(f"{base_url}/a2a/", json=payload)
+    response.raise_for_status()
+    body = response.json()
+    if "error" in body:
+        raise RuntimeError(body["error"].get("message", "A2A error"))
+    state = body["result"]["status"]["state"]
+    if state != "completed":
+        raise RuntimeError(f"A2A task ended in state {state}")
+
+
+async def run_load(
+    base_url: str,
+    target: str,
+    payloads: list[bytes],
+    concurrency: int,
+    timeout: float,
+) -> tuple[list[float], dict[str, int], float]:
+    """Send every payload at the given concurrency, returning latencies, errors and wall time."""
+    send = send_a2a if target == "a2a" else send_combat
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    queue: asyncio.Queue[bytes] = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker() -> None:
+            while not queue.empty():
+                image = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    await send(client, base_url, image)
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    name = type(e).__name__
+                    errors[name] = errors.get(name, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_time = time.perf_counter() - start
+    return latencies, errors, wall_time
+
+
+async def benchmark(
+    target: str,
+    concurrency: int,
+    requests: int,
+    warmup: int,
+    model_latency_ms: float,
+    model_jitter_ms: float,
+    model: str,
+    unique: bool,
+    cache: bool,
+    port: int,
+    base_url: Optional[str],
+    timeout: float,
+) -> dict:
+    fake_model = None
+    if model == "http":
+        fake_model = FakeModelServer(latency_ms=model_latency_ms, jitter_ms=model_jitter_ms).start()
+    server = None
+    try:
+        if base_url is None:
+            model_url = fake_model.url if fake_model else None
+            server = start_server(target, port, model_url, cache, model_latency_ms, model_jitter_ms)
+            base_url = f"http://127.0.0.1:{port}"
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            await wait_ready(client, base_url)
+
+        if warmup:
+            await run_load(base_url, target, load_images(unique, warmup), min(concurrency, warmup), timeout)
+
+        rss_before = read_rss_bytes(server.pid) if server else None
+        latencies, errors, wall_time = await run_load(
+            base_url, target, load_images(unique, requests), concurrency, timeout
+        )
+        rss_after = read_rss_bytes(server.pid) if server else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if fake_model is not None:
+            fake_model.stop()
+
+    failed = sum(errors.values())
+    return {
+        "target": target,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {
+            "concurrency": concurrency,
+            "requests": requests,
+            "warmup": warmup,
+            "model_latency_ms": model_latency_ms,
+            "model_jitter_ms": model_jitter_ms,
+            "model": model,
+            "unique_images": unique,
+            "result_cache": cache,
+        },
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "mean": statistics.fmean(latencies) if latencies else None,
+            "max": max(latencies) if latencies else None,
+        },
+        "throughput_rps": len(latencies) / wall_time if wall_time else 0.0,
+        "wall_time_seconds": wall_time,
+        "error_rate": failed / requests if requests else 0.0,
+        "errors": errors,
+        "memory_bytes": {
+            "rss_before": rss_before,
+            "rss_after": rss_after,
+            "growth": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        },
+    }
+
+
+@click.command()
+@click.option('--target', type=click.Choice(['combat', 'a2a', 'mock']), default='combat', help='Endpoint to drive')
+@click.option('--concurrency', default=8, type=int, help='Requests in flight at once')
+@click.option('--requests', default=200, type=int, help='Measured requests')
+@click.option('--warmup', default=10, type=int, help='Unmeasured requests sent first')
+@click.option('--model-latency-ms', default=300.0, type=float, help='Mean fake model latency')
+@click.option('--model-jitter-ms', default=50.0, type=float, help='Standard deviation of the fake model latency')
+@click.option('--model', type=click.Choice(['http', 'in-process']), default='http',
+              help='Fake model behind a local HTTP server, or the in-process fake chat service')
+@click.option('--unique/--repeat', default=True, help='Make every upload unique to bypass caching and coalescing')
+@click.option('--cache/--no-cache', default=False, help='Leave the result cache enabled on the server')
+@click.option('--port', default=10120, type=int, help='Port for the server under test')
+@click.option('--base-url', default=None, help='Drive an already running server instead of starting one')
+@click.option('--timeout', default=120.0, type=float, help='Per-request timeout in seconds')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write the JSON results to this file')
+def main(target, concurrency, requests, warmup, model_latency_ms, model_jitter_ms, model, unique, cache, port, base_url, timeout, output):
+    """Benchmark the combat pipeline against a local fake model."""
+    results = asyncio.run(benchmark(
+        target, concurrency, requests, warmup, model_latency_ms, model_jitter_ms, model,
+        unique, cache, port, base_url, timeout,
+    ))
+    text = json.dumps(results, indent=2)
+    if output:
+        Path(output).write_text(text + "\n", encoding="utf-8")
+        logger.info(f"Results written to {output}")
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Local detection of the pink and white marker buttons in table photos.
+
+The prompt asks the model to find the soldiers standing in front of pink
+and white buttons, one pair per engagement. Finding the buttons locally lets
+the preprocessor crop the photo to the region around all of them, so the
+model sees fewer pixels.
+"""
+
+import logging
+from collections import deque
+from dataclasses import dataclass
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of the low-resolution copy the detection runs on
+ANALYSIS_EDGE = 512
+
+# Side of the square cells the colour masks are pooled into, in analysis pixels
+CELL_SIZE = 4
+
+# Pillow HSV channels are 0-255; pink hues sit between magenta and red
+PINK_HUE_RANGE = (200, 250)
+PINK_MIN_SATURATION = 18
+PINK_MIN_VALUE = 90
+
+# White must be unsaturated and clearly brighter than the typical pixel
+WHITE_MAX_SATURATION = 40
+WHITE_MIN_VALUE = 190
+WHITE_MIN_CONTRAST = 25
+# ...and brighter than the table immediately around it
+WHITE_MIN_RING_CONTRAST = 16
+
+# Limits that keep blobs button-shaped and button-sized
+MIN_BLOB_CELLS = 4
+MAX_BLOB_FRACTION = 0.05
+MAX_ASPECT_RATIO = 3.0
+MIN_FILL_RATIO = 0.35
+# All buttons are the same physical size, so their areas stay within this factor
+MAX_SIZE_RATIO = 4.0
+
+Box = tuple[float, float, float, float]
+
+
+@dataclass
+class ButtonDetection:
+    """Button bounding boxes as fractions of the image width and height."""
+    pink: list[Box]
+    white: list[Box]
+
+    def crop_box(self, width: int, height: int, padding: float) -> tuple[int, int, int, int]:
+        """Return a pixel box around every button.
+
+        Args:
+            width: Image width in pixels.
+            height: Image height in pixels.
+            padding: Margin added on every side, as a multiple of the largest button's size.
+        """
+        boxes = self.pink + self.white
+        button_size = max(
+            max((box[2] - box[0]) * width, (box[3] - box[1]) * height)
+            for box in boxes
+        )
+        margin = button_size * padding
+        left = min(box[0] for box in boxes) * width - margin
+        top = min(box[1] for box in boxes) * height - margin
+        right = max(box[2] for box in boxes) * width + margin
+        bottom = max(box[3] for box in boxes) * height + margin
+        return (
+            max(int(left), 0),
+            max(int(top), 0),
+            min(int(right + 0.5), width),
+            min(int(bottom + 0.5), height),
+        )
+
+
+class ButtonDetector:
+    """Finds the pink and white buttons with colour segmentation on a small copy of the photo."""
+
+    def detect(self, image_bytes: bytes) -> ButtonDetection | None:
+        """Locate every button pair, or return None unless both colours are found with confidence.
+
+        Args:
+            image_bytes: The uploaded image.
+
+        Returns:
+            ButtonDetection | None: Boxes relative to the EXIF-oriented image.
+        """
+        try:
+            image = Image.open(BytesIO(image_bytes))
+            # JPEG decoding can scale down by up to 8x, far cheaper than a full decode
+            image.draft("RGB", (ANALYSIS_EDGE, ANALYSIS_EDGE))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE))
+            hsv = np.asarray(image.convert("RGB").convert("HSV"), dtype=np.int16)
+        except (UnidentifiedImageError, OSError) as e:
+            logger.warning(f"Button detection could not decode the image: {e}")
+            return None
+
+        hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        pink_mask = (
+            (hue >= PINK_HUE_RANGE[0]) & (hue <= PINK_HUE_RANGE[1])
+            & (saturation >= PINK_MIN_SATURATION) & (value >= PINK_MIN_VALUE)
+        )
+        white_threshold = max(WHITE_MIN_VALUE, float(np.median(value)) + WHITE_MIN_CONTRAST)
+        white_mask = (saturation <= WHITE_MAX_SATURATION) & (value >= white_threshold)
+
+        pink_blobs = _button_blobs(pink_mask)
+        if not pink_blobs:
+            return None
+        # Every engagement has its own pair, and all buttons are about the size of the largest
+        largest_cells = pink_blobs[0][0]
+        pink_boxes = [box for cells, box in pink_blobs if _similar_size(cells, largest_cells)]
+
+        white_boxes = []
+        for white_cells, white_box in _button_blobs(white_mask):
+            # A pink button may sit on a white base, which is not a white button
+            if any(_overlaps(white_box, _expand(pink_box, 0.5)) for pink_box in pink_boxes):
+                continue
+            if not _similar_size(white_cells, largest_cells):
+                continue
+            # A button stands out from its surroundings; a bright patch of table does not
+            if _ring_contrast(value, white_box) < WHITE_MIN_RING_CONTRAST:
+                continue
+            white_boxes.append(white_box)
+        if not white_boxes:
+            return None
+
+        height, width = pink_mask.shape
+        return ButtonDetection(
+            pink=[_relative(box, width, height) for box in pink_boxes],
+            white=[_relative(box, width, height) for box in white_boxes],
+        )
+
+
+def _button_blobs(mask: np.ndarray) -> list[tuple[int, tuple[int, int, int, int]]]:
+    """Return button-like connected regions of a mask, largest first, as (cells, pixel box)."""
+    rows, columns = mask.shape[0] // CELL_SIZE, mask.shape[1] // CELL_SIZE
+    # Pooling into cells removes speckle and makes the flood fill cheap
+    cells = mask[:rows * CELL_SIZE, :columns * CELL_SIZE].reshape(
+        rows, CELL_SIZE, columns, CELL_SIZE
+    ).mean(axis=(1, 3)) >= 0.5
+    max_cells = MAX_BLOB_FRACTION * cells.size
+
+    seen = np.zeros_like(cells)
+    blobs = []
+    for start in zip(*np.nonzero(cells)):
+        if seen[start]:
+            continue
+        seen[start] = True
+        queue = deque([start])
+        count, top, left, bottom, right = 0, start[0], start[1], start[0], start[1]
+        while queue:
+            y, x = queue.popleft()
+            count += 1
+            top, bottom, left, right = min(top, y), max(bottom, y), min(left, x), max(right, x)
+            for ny, nx in ((y + 1, x), (y - 1, x), (y, x + 1), (y, x - 1)):
+                if 0 <= ny < rows and 0 <= nx < columns and cells[ny, nx] and not seen[ny, nx]:
+                    seen[ny, nx] = True
+                    queue.append((ny, nx))
+
+        box_height, box_width = bottom - top + 1, right - left + 1
+        if not MIN_BLOB_CELLS <= count <= max_cells:
+            continue
+        if max(box_width, box_height) > MAX_ASPECT_RATIO * min(box_width, box_height):
+            continue
+        if count < MIN_FILL_RATIO * box_width * box_height:
+            continue
+        blobs.append((count, (
+            left * CELL_SIZE, top * CELL_SIZE, (right + 1) * CELL_SIZE, (bottom + 1) * CELL_SIZE,
+        )))
+    return sorted(blobs, reverse=True)
+
+
+def _ring_contrast(value: np.ndarray, box: tuple[int, int, int, int]) -> float:
+    """Return how much brighter a box is than the typical pixel in the ring around it.
+
+    The median ignores dark objects that happen to border the box, such as a
+    soldier standing next to a bright patch of table.
+    """
+    left, top, right, bottom = box
+    outer_left, outer_top, outer_right, outer_bottom = (int(round(edge)) for edge in _expand(box, 0.5))
+    outer_left, outer_top = max(outer_left, 0), max(outer_top, 0)
+    ring = np.ones(value.shape, dtype=bool)[outer_top:outer_bottom, outer_left:outer_right]
+    ring[top - outer_top:bottom - outer_top, left - outer_left:right - outer_left] = False
+    ring_values = value[outer_top:outer_bottom, outer_left:outer_right][ring]
+    if ring_values.size == 0:
+        return 0.0
+    return float(np.median(value[top:bottom, left:right])) - float(np.median(ring_values))
+
+
+def _similar_size(cells: int, other_cells: int) -> bool:
+    return max(cells, other_cells) <= MAX_SIZE_RATIO * min(cells, other_cells)
+
+
+def _expand(box: tuple[int, int, int, int], fraction: float) -> tuple[float, float, float, float]:
+    dx, dy = (box[2] - box[0]) * fraction, (box[3] - box[1]) * fraction
+    return box[0] - dx, box[1] - dy, box[2] + dx, box[3] + dy
+
+
+def _overlaps(a: tuple[float, ...], b: tuple[float, ...]) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _relative(box: tuple[int, int, int, int], width: int, height: int) -> Box:
+    return float(box[0] / width), float(box[1] / height), float(box[2] / width), float(box[3] / height)
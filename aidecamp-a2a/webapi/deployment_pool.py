@@ -0,0 +1,391 @@
+"""Chat completion service that spreads calls over several model deployments.
+
+One deployment's quota caps throughput, so the pool routes each call to the
+least-loaded healthy deployment. A deployment that answers 429, 5xx or
+cannot be reached is taken out of rotation for a cooldown that doubles
+with consecutive failures, and the call fails over to the next one. The
+pool plugs into Semantic Kernel like any single chat completion service.
+
+For calls made under hedging_allowed(), a call still running after a percentile of recent
+latencies gets a second copy on another deployment; the first answer wins
+and the other call is cancelled. A budget caps hedges to a fraction of
+calls so a slow period cannot double the load.
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Iterator, Optional
+
+import httpx
+import openai
+from pydantic import Field, PrivateAttr
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+
+from metrics import DEPLOYMENT_EJECTIONS, DEPLOYMENT_LATENCY_SECONDS, DEPLOYMENT_REQUESTS, HEDGES
+
+if TYPE_CHECKING:
+    from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+    from semantic_kernel.contents import ChatHistory, ChatMessageContent, StreamingChatMessageContent
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest call in each deployment's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+# Recent latencies of calls that may be hedged, which the hedge delay percentile is taken over,
+# and how many are needed first
+HEDGE_LATENCY_WINDOW = 500
+HEDGE_MIN_SAMPLES = 20
+# Unused hedge budget saved up for bursts of slow calls
+HEDGE_MAX_BUDGET = 10.0
+
+
+@dataclass
+class DeploymentStats:
+    """Snapshot of one deployment's load, health and latency."""
+    name: str
+    healthy: bool
+    in_flight: int
+    requests: int
+    errors: int
+    throttled: int
+    ejections: int
+    mean_latency_ms: Optional[float]
+    cooldown_remaining_seconds: float
+
+
+@dataclass
+class HedgeStats:
+    """Snapshot of hedging counters."""
+    delay_ms: Optional[float]
+    calls: int
+    hedged: int
+    hedge_wins: int
+    primary_wins: int
+    skipped: int
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedged / self.calls if self.calls else 0.0
+
+
+_hedge_allowed: contextvars.ContextVar[bool] = contextvars.ContextVar("hedge_allowed", default=False)
+
+
+@contextmanager
+def hedging_allowed() -> Iterator[None]:
+    """Let pool calls made in the block be hedged; calls elsewhere never are."""
+    token = _hedge_allowed.set(True)
+    try:
+        yield
+    finally:
+        _hedge_allowed.reset(token)
+
+
+class Deployment:
+    """A chat completion service in the pool and its health record."""
+
+    def __init__(self, name: str, service: ChatCompletionClientBase):
+        self.name = name
+        self.service = service
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.ejections = 0
+        self.consecutive_failures = 0
+        self.latency_ms: Optional[float] = None
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def stats(self) -> DeploymentStats:
+        return DeploymentStats(
+            name=self.name,
+            healthy=self.healthy,
+            in_flight=self.in_flight,
+            requests=self.requests,
+            errors=self.errors,
+            throttled=self.throttled,
+            ejections=self.ejections,
+            mean_latency_ms=self.latency_ms,
+            cooldown_remaining_seconds=max(self.ejected_until - time.monotonic(), 0.0),
+        )
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """Return the HTTP status behind a service error, following its causes."""
+    while error is not None:
+        code = getattr(error, "status_code", None)
+        if isinstance(code, int):
+            return code
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Return the Retry-After delay a deployment sent with an error, if any."""
+    while error is not None:
+        response = getattr(error, "response", None)
+        value = response.headers.get("retry-after") if isinstance(response, httpx.Response) else None
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    while error is not None:
+        if isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class DeploymentPool(ChatCompletionClientBase):
+    """Routes chat completions to the least-loaded healthy deployment, failing over on errors.
+
+    Args:
+        deployments: (name, service) pairs; each service answers for one deployment or endpoint.
+        cooldown_seconds: Time out of rotation after a first failure; doubles per consecutive failure.
+        max_cooldown_seconds: Upper bound on the cooldown.
+        hedge_percentile: Latency percentile, over recent calls that may be hedged, after which one is hedged.
+        hedge_min_delay_ms: Shortest hedge delay, however fast recent calls were.
+        hedge_max_rate: Largest fraction of calls that may be hedged.
+    """
+
+    cooldown_seconds: float = Field(default=10.0, ge=0)
+    max_cooldown_seconds: float = Field(default=120.0, ge=0)
+    hedge_percentile: float = Field(default=0.95, gt=0, lt=1)
+    hedge_min_delay_ms: float = Field(default=50.0, ge=0)
+    hedge_max_rate: float = Field(default=0.05, ge=0, le=1)
+
+    _deployments: list[Deployment] = PrivateAttr(default_factory=list)
+    _latencies: deque = PrivateAttr(default_factory=lambda: deque(maxlen=HEDGE_LATENCY_WINDOW))
+    _hedge_budget: float = PrivateAttr(default=0.0)
+    _calls: int = PrivateAttr(default=0)
+    _hedged: int = PrivateAttr(default=0)
+    _hedge_wins: int = PrivateAttr(default=0)
+    _primary_wins: int = PrivateAttr(default=0)
+    _hedges_skipped: int = PrivateAttr(default=0)
+
+    def __init__(self, deployments: list[tuple[str, ChatCompletionClientBase]], **kwargs: Any):
+        if not deployments:
+            raise ValueError("A deployment pool needs at least one deployment")
+        super().__init__(**kwargs)
+        self._deployments = [Deployment(name, service) for name, service in deployments]
+
+    @property
+    def services(self) -> list[ChatCompletionClientBase]:
+        """The pooled services, for warm-up and shutdown."""
+        return [deployment.service for deployment in self._deployments]
+
+    def stats(self) -> list[DeploymentStats]:
+        return [deployment.stats() for deployment in self._deployments]
+
+    def hedge_stats(self) -> HedgeStats:
+        delay = self.hedge_delay()
+        return HedgeStats(
+            delay_ms=delay * 1000 if delay is not None else None,
+            calls=self._calls,
+            hedged=self._hedged,
+            hedge_wins=self._hedge_wins,
+            primary_wins=self._primary_wins,
+            skipped=self._hedges_skipped,
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds a call may run before it is hedged, or None until enough calls were timed."""
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(int(self.hedge_percentile * len(ordered)), len(ordered) - 1)
+        return max(ordered[index], self.hedge_min_delay_ms / 1000)
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return OpenAIChatPromptExecutionSettings
+
+    async def _inner_get_chat_message_contents(
+        self,
+        chat_history: "ChatHistory",
+        settings: "PromptExecutionSettings",
+    ) -> list["ChatMessageContent"]:
+        self._calls += 1
+        # Every call earns a fraction of a hedge, which caps the hedge rate
+        self._hedge_budget = min(self._hedge_budget + self.hedge_max_rate, HEDGE_MAX_BUDGET)
+        tried: set[str] = set()
+        delay = self.hedge_delay() if _hedge_allowed.get() and len(self._deployments) > 1 else None
+        if delay is None:
+            return await self._call_with_failover(chat_history, settings, tried)
+
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._call_with_failover(chat_history, settings, tried))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            if self._hedge_budget < 1:
+                self._skip_hedge("skipped_budget")
+                return await primary
+            if not any(d.healthy and d.name not in tried for d in self._deployments):
+                self._skip_hedge("skipped_no_deployment")
+                return await primary
+
+            self._hedge_budget -= 1
+            self._hedged += 1
+            # The shared tried set sends the hedge, and any failover of either call, elsewhere
+            hedge = asyncio.ensure_future(self._call_with_failover(chat_history, settings, tried))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._hedge_wins += 1
+                            HEDGES.inc(result="hedge_won")
+                            # The cancelled primary took at least this long; leaving it out would lower the delay
+                            self._latencies.append(time.monotonic() - start)
+                        else:
+                            self._primary_wins += 1
+                            HEDGES.inc(result="primary_won")
+                        return task.result()
+            HEDGES.inc(result="both_failed")
+            raise primary.exception()
+        finally:
+            # The losing call is cancelled rather than left to use quota
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def _skip_hedge(self, reason: str) -> None:
+        self._hedges_skipped += 1
+        HEDGES.inc(result=reason)
+
+    async def _call_with_failover(
+        self,
+        chat_history: "ChatHistory",
+        settings: "PromptExecutionSettings",
+        tried: set[str],
+    ) -> list["ChatMessageContent"]:
+        """Call one deployment, failing over to untried ones on retryable errors."""
+        while True:
+            deployment = self._choose(tried)
+            tried.add(deployment.name)
+            start = time.monotonic()
+            deployment.in_flight += 1
+            try:
+                # Each deployment fills in its own messages and model id
+                result = await deployment.service._inner_get_chat_message_contents(
+                    chat_history, settings.model_copy()
+                )
+            except Exception as e:
+                if not self._record_failure(deployment, e) or len(tried) == len(self._deployments):
+                    raise
+                continue
+            finally:
+                deployment.in_flight -= 1
+            self._record_success(deployment, time.monotonic() - start)
+            return result
+
+    async def _inner_get_streaming_chat_message_contents(
+        self,
+        chat_history: "ChatHistory",
+        settings: "PromptExecutionSettings",
+        function_invoke_attempt: int = 0,
+    ) -> AsyncGenerator[list["StreamingChatMessageContent"], Any]:
+        tried: set[str] = set()
+        while True:
+            deployment = self._choose(tried)
+            tried.add(deployment.name)
+            start = time.monotonic()
+            started = False
+            deployment.in_flight += 1
+            try:
+                async for chunk in deployment.service._inner_get_streaming_chat_message_contents(
+                    chat_history, settings.model_copy(), function_invoke_attempt
+                ):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                retryable = self._record_failure(deployment, e)
+                # Chunks already passed on cannot be taken back, so only fail over before the first
+                if started or not retryable or len(tried) == len(self._deployments):
+                    raise
+                continue
+            finally:
+                deployment.in_flight -= 1
+            self._record_success(deployment, time.monotonic() - start)
+            return
+
+    def _choose(self, tried: set[str]) -> Deployment:
+        """Pick the healthy untried deployment with the fewest calls in flight, then the fastest.
+
+        When every untried deployment is cooling down, the one recovering
+        soonest is used rather than failing the call outright.
+        """
+        untried = [deployment for deployment in self._deployments if deployment.name not in tried]
+        healthy = [deployment for deployment in untried if deployment.healthy]
+        if not healthy:
+            return min(untried, key=lambda deployment: deployment.ejected_until)
+        return min(healthy, key=lambda deployment: (deployment.in_flight, deployment.latency_ms or 0.0))
+
+    def _record_success(self, deployment: Deployment, seconds: float) -> None:
+        deployment.requests += 1
+        deployment.consecutive_failures = 0
+        if _hedge_allowed.get():
+            # Other calls, such as text-only repairs, are faster and would bring hedges forward
+            self._latencies.append(seconds)
+        latency_ms = seconds * 1000
+        if deployment.latency_ms is None:
+            deployment.latency_ms = latency_ms
+        else:
+            deployment.latency_ms += LATENCY_SMOOTHING * (latency_ms - deployment.latency_ms)
+        DEPLOYMENT_REQUESTS.inc(deployment=deployment.name, result="ok")
+        DEPLOYMENT_LATENCY_SECONDS.observe(seconds, deployment=deployment.name)
+
+    def _record_failure(self, deployment: Deployment, error: Exception) -> bool:
+        """Count a failed call and eject the deployment if it is at fault.
+
+        Returns:
+            bool: Whether another deployment may succeed where this one failed.
+        """
+        deployment.requests += 1
+        deployment.errors += 1
+        code = status_code(error)
+        if code == 429:
+            deployment.throttled += 1
+            result = "throttled"
+        elif (code is not None and code >= 500) or (code is None and _is_connection_error(error)):
+            result = "server_error"
+        else:
+            # Bad requests and content filtering fail the same way everywhere
+            DEPLOYMENT_REQUESTS.inc(deployment=deployment.name, result="client_error")
+            return False
+        DEPLOYMENT_REQUESTS.inc(deployment=deployment.name, result=result)
+
+        deployment.consecutive_failures += 1
+        cooldown = min(
+            self.cooldown_seconds * 2 ** (deployment.consecutive_failures - 1),
+            self.max_cooldown_seconds,
+        )
+        cooldown = max(cooldown, retry_after_seconds(error) or 0.0)
+        deployment.ejected_until = time.monotonic() + cooldown
+        deployment.ejections += 1
+        DEPLOYMENT_EJECTIONS.inc(deployment=deployment.name)
+        logger.warning(
+            f"Deployment {deployment.name} ejected for {cooldown:.1f}s after "
+            f"{code or 'connection failure'}: {error}"
+        )
+        return True
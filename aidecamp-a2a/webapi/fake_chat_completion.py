@@ -0,0 +1,237 @@
+"""Offline chat completion service for profiling without a model endpoint.
+
+The fake plugs into Semantic Kernel like the Azure OpenAI and OpenAI services,
+so process_image, the A2A executor and the HTTP routes run unchanged. Every
+answer is a valid scenario derived from a hash of the last image in the chat
+history, which keeps repeated runs comparable.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+from enum import Enum
+from typing import TYPE_CHECKING, Any, AsyncGenerator
+
+import httpx
+import openai
+from openai.types.completion_usage import PromptTokensDetails
+from pydantic import Field, PrivateAttr
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.completion_usage import CompletionUsage
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.contents import (
+    AuthorRole,
+    ChatMessageContent,
+    ImageContent,
+    StreamingChatMessageContent,
+    StreamingTextContent,
+    TextContent,
+)
+from semantic_kernel.contents.utils.finish_reason import FinishReason
+from semantic_kernel.exceptions import ServiceResponseException
+
+from models import Pose, Weapon
+
+if TYPE_CHECKING:
+    from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+    from semantic_kernel.contents import ChatHistory
+
+# Characters per streamed chunk, roughly one token each way
+STREAM_CHUNK_CHARS = 16
+
+# Providers cache prompt prefixes of at least this many tokens, in steps of the increment
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+
+# Most engagements in one fake answer
+MAX_FAKE_ENGAGEMENTS = 3
+
+
+class LatencyDistribution(str, Enum):
+    """Shape of the simulated model latency."""
+
+    FIXED = 'fixed'
+    """Always the mean latency."""
+    NORMAL = 'normal'
+    """Gaussian around the mean, clipped at zero."""
+    LOGNORMAL = 'lognormal'
+    """Right-skewed with the given mean and standard deviation, like real model calls."""
+
+
+def scenario_for_image(image_data: bytes) -> dict[str, Any]:
+    """Return a deterministic turn of one to MAX_FAKE_ENGAGEMENTS engagements for an image.
+
+    Args:
+        image_data: The image bytes, or any other content to derive the scenario from.
+
+    Returns:
+        dict: Scenario JSON matching TurnScenarioModel.
+    """
+    digest = hashlib.sha256(image_data).digest()
+    count = 1 + digest[0] % MAX_FAKE_ENGAGEMENTS
+    return {
+        "engagements": [_engagement(hashlib.sha256(digest + bytes([index])).digest()) for index in range(count)],
+    }
+
+
+def _engagement(digest: bytes) -> dict[str, Any]:
+    poses = list(Pose)
+    weapons = list(Weapon)
+    return {
+        "firing": {
+            "coordinates": {"x": digest[0], "y": digest[1]},
+            "pose": poses[digest[2] % len(poses)].value,
+            "weapon": weapons[digest[3] % len(weapons)].value,
+            "height": 40 + digest[9] % 60,
+        },
+        "target": {
+            "coordinates": {"x": digest[4], "y": digest[5]},
+            "pose": poses[digest[6] % len(poses)].value,
+            "weapon": weapons[digest[7] % len(weapons)].value,
+            "height": 40 + digest[10] % 60,
+        },
+        # The model's estimate, cross-checked against the one calculated from coordinates and heights
+        "distance": {"value": 20 + digest[11] % 160, "unit": "cm", "estimated": True},
+    }
+
+
+class FakeChatCompletion(ChatCompletionClientBase):
+    """Chat completion service that answers locally after a simulated delay.
+
+    Args:
+        latency_ms: Mean simulated latency per call.
+        jitter_ms: Standard deviation of the latency; ignored when fixed.
+        distribution: Shape of the latency distribution.
+        failure_rate: Fraction of calls that raise ServiceResponseException.
+        failure_status_code: HTTP status of the simulated failures, e.g. 429 or 500.
+        retry_after_seconds: Retry-After sent with simulated failures; 0 sends none.
+        prompt_tokens: Prompt tokens reported in the usage metadata.
+            Repeated system prompts are reported as cached, like provider prompt caching.
+        completion_tokens: Completion tokens reported in the usage metadata.
+        seed: Seed for latency and failure sampling; None for a random seed.
+    """
+
+    latency_ms: float = Field(default=300.0, ge=0)
+    jitter_ms: float = Field(default=50.0, ge=0)
+    distribution: LatencyDistribution = LatencyDistribution.LOGNORMAL
+    failure_rate: float = Field(default=0.0, ge=0, le=1)
+    failure_status_code: int = Field(default=500, ge=400, le=599)
+    retry_after_seconds: float = Field(default=0.0, ge=0)
+    prompt_tokens: int = Field(default=1500, ge=0)
+    completion_tokens: int = Field(default=80, ge=0)
+    seed: int | None = None
+
+    _random: random.Random = PrivateAttr(default_factory=random.Random)
+    _seen_prefixes: set[str] = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._random = random.Random(self.seed)
+
+    def get_prompt_execution_settings_class(self) -> type["PromptExecutionSettings"]:
+        return OpenAIChatPromptExecutionSettings
+
+    def sample_latency(self) -> float:
+        """Draw one simulated latency in seconds."""
+        if self.distribution == LatencyDistribution.FIXED or self.jitter_ms == 0:
+            latency_ms = self.latency_ms
+        elif self.distribution == LatencyDistribution.NORMAL:
+            latency_ms = self._random.gauss(self.latency_ms, self.jitter_ms)
+        elif self.latency_ms > 0:
+            # Choose mu and sigma so the samples have the configured mean and deviation
+            sigma = math.sqrt(math.log(1 + (self.jitter_ms / self.latency_ms) ** 2))
+            mu = math.log(self.latency_ms) - sigma ** 2 / 2
+            latency_ms = self._random.lognormvariate(mu, sigma)
+        else:
+            latency_ms = 0
+        return max(latency_ms, 0) / 1000
+
+    async def _simulate_call(self) -> None:
+        await asyncio.sleep(self.sample_latency())
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            # Wrapped like a real endpoint's error so callers can read the status and Retry-After
+            headers = {"retry-after": str(self.retry_after_seconds)} if self.retry_after_seconds else {}
+            response = httpx.Response(
+                self.failure_status_code,
+                headers=headers,
+                request=httpx.Request("POST", "http://fake/chat/completions"),
+            )
+            error = openai.APIStatusError("Simulated failure", response=response, body=None)
+            raise ServiceResponseException("Simulated chat completion failure") from error
+
+    def _answer(self, chat_history: "ChatHistory") -> str:
+        return json.dumps(scenario_for_image(_last_user_content(chat_history)))
+
+    def _cached_tokens(self, chat_history: "ChatHistory") -> int:
+        """Report the system prompt as cached once an identical one has been seen."""
+        system = next((m.content for m in chat_history.messages if m.role == AuthorRole.SYSTEM), "")
+        prefix = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        seen = prefix in self._seen_prefixes
+        self._seen_prefixes.add(prefix)
+        # Roughly four characters per token
+        prefix_tokens = min(len(system) // 4, self.prompt_tokens)
+        if not seen or prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        return prefix_tokens - prefix_tokens % PROMPT_CACHE_INCREMENT
+
+    def _metadata(self, chat_history: "ChatHistory") -> dict[str, Any]:
+        return {
+            "usage": CompletionUsage(
+                prompt_tokens=self.prompt_tokens,
+                prompt_tokens_details=PromptTokensDetails(cached_tokens=self._cached_tokens(chat_history)),
+                completion_tokens=self.completion_tokens,
+            ),
+        }
+
+    async def _inner_get_chat_message_contents(
+        self,
+        chat_history: "ChatHistory",
+        settings: "PromptExecutionSettings",
+    ) -> list["ChatMessageContent"]:
+        await self._simulate_call()
+        return [
+            ChatMessageContent(
+                role=AuthorRole.ASSISTANT,
+                content=self._answer(chat_history),
+                ai_model_id=self.ai_model_id,
+                finish_reason=FinishReason.STOP,
+                metadata=self._metadata(chat_history),
+            )
+        ]
+
+    async def _inner_get_streaming_chat_message_contents(
+        self,
+        chat_history: "ChatHistory",
+        settings: "PromptExecutionSettings",
+        function_invoke_attempt: int = 0,
+    ) -> AsyncGenerator[list["StreamingChatMessageContent"], Any]:
+        await self._simulate_call()
+        content = self._answer(chat_history)
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        for index, piece in enumerate(pieces):
+            last = index == len(pieces) - 1
+            yield [
+                StreamingChatMessageContent(
+                    role=AuthorRole.ASSISTANT,
+                    choice_index=0,
+                    items=[StreamingTextContent(choice_index=0, text=piece)],
+                    ai_model_id=self.ai_model_id,
+                    finish_reason=FinishReason.STOP if last else None,
+                    metadata=self._metadata(chat_history) if last else {},
+                    function_invoke_attempt=function_invoke_attempt,
+                )
+            ]
+
+
+def _last_user_content(chat_history: "ChatHistory") -> bytes:
+    """Return the image in the newest user message, or its text if it has no image."""
+    for message in reversed(chat_history.messages):
+        if message.role != AuthorRole.USER:
+            continue
+        for item in message.items:
+            if isinstance(item, ImageContent) and item.data:
+                return item.data
+        return "".join(item.text for item in message.items if isinstance(item, TextContent)).encode("utf-8")
+    return b""
@@ -0,0 +1,267 @@
+"""Per-session game state updated incrementally from combat results.
+
+Instead of replaying the chat history, each model call receives a short
+summary of the units on the table, their casualties and the turn number.
+The state keeps a bounded number of units and a spatial grid over their
+positions, so applying a turn and rendering the summary cost the same on
+the hundredth turn as on the first.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from models import Characteristics, CombatResult, Pose, Weapon
+
+logger = logging.getLogger(__name__)
+
+Cell = tuple[int, int]
+
+
+@dataclass
+class UnitState:
+    """A toy soldier seen in at least one turn."""
+    unit_id: int
+    weapon: Weapon
+    pose: Pose
+    x: int
+    y: int
+    last_turn: int
+    shots: int = 0
+    hits: int = 0
+    times_targeted: int = 0
+
+
+@dataclass
+class GameState:
+    """Units, positions, casualties and turn number of one game.
+
+    Soldiers are matched to known units of the same weapon within a radius
+    of their position, nearest pairs first; unmatched soldiers become new units. A unit stands
+    for one soldier per turn, so a firer and target close together stay
+    apart; a soldier at the very same position in another engagement of the
+    turn is taken to be the same soldier. Only soldiers with coordinates
+    are tracked.
+
+    Args:
+        match_radius: Distance in image pixels within which a soldier is taken to be a known unit.
+        max_units: Units kept on the table; the longest unseen are dropped beyond it.
+        max_casualties: Casualties listed in the summary; older ones are only counted.
+    """
+    match_radius: int = 100
+    max_units: int = 32
+    max_casualties: int = 8
+    turn: int = 0
+    shots: int = 0
+    hits: int = 0
+    casualty_count: int = 0
+    units: OrderedDict[int, UnitState] = field(default_factory=OrderedDict)
+    casualties: list[UnitState] = field(default_factory=list)
+    # Unit ids by grid cell of side match_radius, for constant-time matching
+    _grid: dict[Cell, set[int]] = field(default_factory=dict, init=False, repr=False)
+    _next_id: int = field(default=1, init=False, repr=False)
+
+    def apply(self, result: CombatResult) -> None:
+        """Advance one turn with the engagements of a combat result."""
+        self.turn += 1
+        engagements = result.engagements or [result]
+        # Soldiers of this turn, and their indexes as firer and target of each engagement
+        soldiers: list[Characteristics] = []
+        roles: list[tuple[Optional[int], Optional[int]]] = []
+        for engagement in engagements:
+            firing = self._soldier_index(engagement.scenario.firing, soldiers)
+            target = self._soldier_index(engagement.scenario.target, soldiers, exclude=firing)
+            roles.append((firing, target))
+        units = self._observe(soldiers)
+
+        for engagement, (firing_index, target_index) in zip(engagements, roles):
+            self.shots += 1
+            hit = engagement.outcome.hit_or_miss
+            firing = units[firing_index] if firing_index is not None else None
+            target = units[target_index] if target_index is not None else None
+            if firing is not None:
+                firing.shots += 1
+            if target is not None:
+                target.times_targeted += 1
+            if hit:
+                self.hits += 1
+                if target is not None:
+                    target.hits += 1
+                    # A target hit by two firers in one turn is one casualty
+                    if target.unit_id in self.units:
+                        self._remove_casualty(target)
+
+    def summary(self) -> str:
+        """Return the state as a few lines of text for the prompt."""
+        lines = [
+            f"Turn {self.turn} completed: {self.shots} shots, {self.hits} hits, "
+            f"{self.casualty_count} casualties."
+        ]
+        if self.units:
+            lines.append("Units on the table:")
+            lines.extend(
+                f"- #{unit.unit_id} {unit.pose.value} {unit.weapon.value} at ({unit.x}, {unit.y}), "
+                f"fired {unit.shots}, targeted {unit.times_targeted}"
+                for unit in self.units.values()
+            )
+        if self.casualties:
+            lines.append(
+                "Casualties: " + ", ".join(
+                    f"#{unit.unit_id} {unit.weapon.value} at ({unit.x}, {unit.y})" for unit in self.casualties
+                )
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def _soldier_index(
+        soldier: Characteristics,
+        soldiers: list[Characteristics],
+        exclude: Optional[int] = None,
+    ) -> Optional[int]:
+        """Return the index of a soldier among the turn's soldiers, adding it if it is new.
+
+        Args:
+            soldier: A soldier of one engagement.
+            soldiers: Soldiers of the turn so far; the soldier is appended if new.
+            exclude: Index of a soldier it cannot be, such as the firer of the same engagement.
+        """
+        if soldier.coordinates is None:
+            return None
+        for index, known in enumerate(soldiers):
+            # The same soldier listed in another engagement of this turn
+            if (
+                index != exclude
+                and known.weapon == soldier.weapon
+                and known.coordinates == soldier.coordinates
+            ):
+                return index
+        soldiers.append(soldier)
+        return len(soldiers) - 1
+
+    def _observe(self, soldiers: list[Characteristics]) -> list[UnitState]:
+        """Update the units the turn's soldiers match, adding the unmatched ones as new units.
+
+        Pairs of soldier and known unit are matched nearest first, so a
+        soldier listed early cannot take a unit from a nearer one listed later.
+        """
+        candidates = []
+        for index, soldier in enumerate(soldiers):
+            x, y = soldier.coordinates.x, soldier.coordinates.y
+            column, row = self._cell(x, y)
+            # With cells as wide as the radius, any match is in the surrounding 3x3 block
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for unit_id in self._grid.get((column + dx, row + dy), ()):
+                        unit = self.units[unit_id]
+                        distance = (unit.x - x) ** 2 + (unit.y - y) ** 2
+                        if unit.weapon == soldier.weapon and distance <= self.match_radius ** 2:
+                            candidates.append((distance, index, unit_id))
+
+        units: dict[int, UnitState] = {}
+        taken: set[int] = set()
+        for _, index, unit_id in sorted(candidates):
+            if index not in units and unit_id not in taken:
+                units[index] = self.units[unit_id]
+                taken.add(unit_id)
+
+        for index, soldier in enumerate(soldiers):
+            x, y = soldier.coordinates.x, soldier.coordinates.y
+            unit = units.get(index)
+            if unit is None:
+                unit = UnitState(
+                    unit_id=self._next_id, weapon=soldier.weapon, pose=soldier.pose, x=x, y=y, last_turn=self.turn
+                )
+                self._next_id += 1
+                units[index] = unit
+                self.units[unit.unit_id] = unit
+            else:
+                self._unindex(unit)
+                unit.pose, unit.x, unit.y, unit.last_turn = soldier.pose, x, y, self.turn
+                # Keep units ordered by when they were last seen
+                self.units.move_to_end(unit.unit_id)
+            self._index(unit)
+
+        while len(self.units) > self.max_units:
+            self._unindex(next(iter(self.units.values())))
+            self.units.popitem(last=False)
+        return [units[index] for index in range(len(soldiers))]
+
+    def _remove_casualty(self, unit: UnitState) -> None:
+        self._unindex(unit)
+        del self.units[unit.unit_id]
+        self.casualty_count += 1
+        self.casualties.append(unit)
+        if len(self.casualties) > self.max_casualties:
+            self.casualties.pop(0)
+
+    def _cell(self, x: int, y: int) -> Cell:
+        size = max(self.match_radius, 1)
+        return x // size, y // size
+
+    def _index(self, unit: UnitState) -> None:
+        self._grid.setdefault(self._cell(unit.x, unit.y), set()).add(unit.unit_id)
+
+    def _unindex(self, unit: UnitState) -> None:
+        cell = self._cell(unit.x, unit.y)
+        unit_ids = self._grid.get(cell)
+        if unit_ids is not None:
+            unit_ids.discard(unit.unit_id)
+            if not unit_ids:
+                del self._grid[cell]
+
+
+class GameStateStore:
+    """Game states keyed by session id, with LRU and idle-TTL eviction.
+
+    Args:
+        max_entries: Maximum number of games kept; 0 disables the limit.
+        ttl_seconds: Idle time after which a game expires; 0 disables expiry.
+        match_radius: Unit match radius passed to new game states.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, match_radius: int = 100):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.match_radius = match_radius
+        # session id -> (state, last access time), oldest first
+        self._entries: OrderedDict[str, tuple[GameState, float]] = OrderedDict()
+        self._evictions = 0
+
+    def get(self, session_id: str) -> GameState:
+        """Return the game state of a session, starting a new game if there is none."""
+        self._expire()
+        entry = self._entries.pop(session_id, None)
+        state = entry[0] if entry is not None else GameState(match_radius=self.match_radius)
+        self._entries[session_id] = (state, time.monotonic())
+        while self.max_entries > 0 and len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._evictions += 1
+            logger.info(f"Game state evicted: {evicted}")
+        return state
+
+    def pop(self, session_id: str) -> Optional[GameState]:
+        """Remove and return the game state of a session."""
+        entry = self._entries.pop(session_id, None)
+        return entry[0] if entry is not None else None
+
+    @property
+    def evictions(self) -> int:
+        return self._evictions
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self) -> None:
+        """Drop games idle for longer than the TTL."""
+        if self.ttl_seconds <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            session_id, (_, last_access) = next(iter(self._entries.items()))
+            if last_access > deadline:
+                break
+            del self._entries[session_id]
+            self._evictions += 1
+            logger.info(f"Game state expired: {session_id}")
@@ -0,0 +1,205 @@
+"""Image preprocessing applied to uploads before they are sent to the model."""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from button_detector import ButtonDetector
+from metrics import BUTTON_DETECTIONS, CROP_AREA_RATIO, time_stage
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name -> MIME type accepted by the vision model
+_FORMAT_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+# EXIF orientations that rotate the image by 90 degrees
+_TRANSPOSING_ORIENTATIONS = {5, 6, 7, 8}
+
+# Crops keeping more than this share of the image are not worth re-encoding for
+MAX_CROP_AREA_RATIO = 0.9
+
+# Decoding failures after which the upload is forwarded unchanged
+_DECODE_ERRORS = (UnidentifiedImageError, OSError, Image.DecompressionBombError)
+
+
+@dataclass
+class PreprocessedImage:
+    """An image ready to be base64-encoded for the model."""
+    data: bytes
+    mime_type: str
+    original_size: int
+    width: int = 0
+    height: int = 0
+    crop_box: tuple[int, int, int, int] | None = None
+    """Region of the upright original that was kept, in its pixels."""
+    scale: float = 1.0
+    """Pixels sent per pixel of the upright original."""
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - len(self.data)
+
+    def to_original(self, x: int, y: int) -> tuple[int, int]:
+        """Map a point in the sent image back to the upright original image."""
+        left, top = self.crop_box[:2] if self.crop_box else (0, 0)
+        return round(left + x / self.scale), round(top + y / self.scale)
+
+
+@dataclass
+class ImagePreprocessorStats:
+    """Cumulative preprocessing counters."""
+    images: int
+    bytes_in: int
+    bytes_out: int
+    cropped: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+
+class ImagePreprocessor:
+    """Sniffs, downscales and re-encodes uploads to cut request size and image tokens.
+
+    Args:
+        max_edge: Longest edge in pixels after downscaling; 0 disables resizing.
+        quality: JPEG quality used when re-encoding.
+        strip_exif: Whether to drop EXIF and other metadata.
+        button_detector: Optional detector of the marker buttons; when they are
+            found the image is cropped to the region around them.
+        crop_padding: Margin kept around the buttons, as a multiple of their size.
+    """
+
+    def __init__(
+        self,
+        max_edge: int = 1536,
+        quality: int = 85,
+        strip_exif: bool = True,
+        button_detector: ButtonDetector | None = None,
+        crop_padding: float = 1.5,
+    ):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.strip_exif = strip_exif
+        self.button_detector = button_detector
+        self.crop_padding = crop_padding
+        self._images = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._cropped = 0
+
+    async def process_async(self, image_bytes: bytes) -> PreprocessedImage:
+        """Preprocess an image in a worker thread so the event loop is not blocked."""
+        result = await asyncio.to_thread(self.process, image_bytes)
+        self._images += 1
+        self._bytes_in += result.original_size
+        self._bytes_out += len(result.data)
+        if result.crop_box is not None:
+            self._cropped += 1
+        logger.info(
+            f"Preprocessed image {result.original_size} -> {len(result.data)} bytes "
+            f"({result.bytes_saved} saved, {result.width}x{result.height} {result.mime_type})"
+        )
+        return result
+
+    def process(self, image_bytes: bytes) -> PreprocessedImage:
+        """Preprocess an image, returning the original bytes when no change is needed."""
+        try:
+            image = Image.open(BytesIO(image_bytes))
+            image_format = image.format
+        except _DECODE_ERRORS as e:
+            # Let the model reject it; the label is the previous default
+            logger.warning(f"Could not decode uploaded image, sending as-is: {e}")
+            return PreprocessedImage(data=image_bytes, mime_type="image/jpeg", original_size=len(image_bytes))
+
+        width, height = image.size
+        original = PreprocessedImage(
+            data=image_bytes,
+            mime_type=_FORMAT_MIME_TYPES.get(image_format, "image/jpeg"),
+            original_size=len(image_bytes),
+            width=width,
+            height=height,
+        )
+
+        try:
+            return self._transform(image, image_bytes, original)
+        except _DECODE_ERRORS as e:
+            # Truncated or corrupt data only shows up once the pixels are decoded
+            logger.warning(f"Could not decode uploaded image, sending as-is: {e}")
+            return original
+
+    def _transform(self, image: Image.Image, image_bytes: bytes, original: PreprocessedImage) -> PreprocessedImage:
+        """Crop, downscale and re-encode an opened image, or return the original when not needed."""
+        image_format = image.format
+        width, height = image.size
+        crop_box = self._find_crop_box(image_bytes, image)
+
+        needs_resize = self.max_edge > 0 and max(width, height) > self.max_edge
+        has_metadata = bool(image.info.get("exif")) or bool(image.getexif())
+        needs_strip = self.strip_exif and has_metadata
+        if not needs_resize and not needs_strip and crop_box is None and image_format in _FORMAT_MIME_TYPES:
+            return original
+
+        # Apply the EXIF orientation before the metadata carrying it is dropped
+        image = ImageOps.exif_transpose(image)
+        if crop_box is not None:
+            image = image.crop(crop_box)
+        kept_width = image.width
+        if needs_resize:
+            image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        output = BytesIO()
+        save_options = {"quality": self.quality, "optimize": True}
+        if not self.strip_exif and "exif" in image.info:
+            save_options["exif"] = image.info["exif"]
+        image.save(output, format="JPEG", **save_options)
+
+        return PreprocessedImage(
+            data=output.getvalue(),
+            mime_type="image/jpeg",
+            original_size=len(image_bytes),
+            width=image.width,
+            height=image.height,
+            crop_box=crop_box,
+            scale=image.width / kept_width,
+        )
+
+    def _find_crop_box(self, image_bytes: bytes, image: Image.Image) -> tuple[int, int, int, int] | None:
+        """Return the region around the marker buttons, or None to keep the whole image."""
+        if self.button_detector is None:
+            return None
+        with time_stage("button_detection"):
+            detection = self.button_detector.detect(image_bytes)
+        if detection is None:
+            BUTTON_DETECTIONS.inc(result="not_found")
+            return None
+
+        width, height = image.size
+        if image.getexif().get(0x0112) in _TRANSPOSING_ORIENTATIONS:
+            width, height = height, width
+        crop_box = detection.crop_box(width, height, self.crop_padding)
+        area_ratio = (crop_box[2] - crop_box[0]) * (crop_box[3] - crop_box[1]) / (width * height)
+        if area_ratio > MAX_CROP_AREA_RATIO:
+            BUTTON_DETECTIONS.inc(result="full_frame")
+            return None
+        BUTTON_DETECTIONS.inc(result="cropped")
+        CROP_AREA_RATIO.observe(area_ratio)
+        return crop_box
+
+    def stats(self) -> ImagePreprocessorStats:
+        return ImagePreprocessorStats(
+            images=self._images,
+            bytes_in=self._bytes_in,
+            bytes_out=self._bytes_out,
+            cropped=self._cropped,
+        )
@@ -0,0 +1,253 @@
+"""Lightweight Prometheus-style metrics for the wargaming services.
+
+Only the standard library is used so the mock server can expose the same
+metrics with its minimal dependencies.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+from typing import Callable, Iterator
+
+# Latency buckets in seconds, from sub-millisecond parsing to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """A value sampled from a callback when metrics are rendered."""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.callback()}",
+        ]
+
+
+class Histogram:
+    """A distribution of observed values in cumulative buckets, optionally split by labels."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> (per-bucket counts with a trailing +Inf slot, sum)
+        self._series: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._series[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall time of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics by name and renders them in the Prometheus text format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        # Re-registering replaces the callback, e.g. when an app is rebuilt
+        gauge = Gauge(name, help_text, callback)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "wargaming_stage_duration_seconds",
+    "Time spent in each stage of a combat request.",
+    ("stage",),
+)
+
+ERRORS = REGISTRY.counter(
+    "wargaming_errors_total",
+    "Errors raised while handling requests, by exception type.",
+    ("type",),
+)
+
+REPAIRS = REGISTRY.counter(
+    "wargaming_response_repairs_total",
+    "Text-only calls made to repair an invalid scenario answer, by result.",
+    ("result",),
+)
+
+MODEL_TOKENS = REGISTRY.counter(
+    "wargaming_model_tokens_total",
+    "Tokens reported by the model, by kind: uncached prompt, cached prompt or completion.",
+    ("kind",),
+)
+
+PROMPT_CACHE_REQUESTS = REGISTRY.counter(
+    "wargaming_prompt_cache_requests_total",
+    "Model calls by whether part of the prompt was served from the provider's prompt cache.",
+    ("result",),
+)
+
+BUTTON_DETECTIONS = REGISTRY.counter(
+    "wargaming_button_detections_total",
+    "Marker button detections before the model call, by result: cropped, not_found or full_frame.",
+    ("result",),
+)
+
+CROP_AREA_RATIO = REGISTRY.histogram(
+    "wargaming_crop_area_ratio",
+    "Share of the image area kept when cropping to the marker buttons.",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9),
+)
+
+DISTANCE_SOURCES = REGISTRY.counter(
+    "wargaming_distance_source_total",
+    "Scenario distances by where they came from: user, calculated or model, or none when the engagement is dropped.",
+    ("source",),
+)
+
+DISTANCE_DISCREPANCY_CM = REGISTRY.histogram(
+    "wargaming_distance_discrepancy_cm",
+    "Difference between the calculated distance and the given or model-estimated one, in cm.",
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "wargaming_admission_wait_seconds",
+    "Time model-bound requests waited for a concurrency slot and rate-limit budget.",
+)
+
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "wargaming_admission_rejections_total",
+    "Model-bound requests turned away: queue_full, timeout or rate_limited.",
+    ("reason",),
+)
+
+DEPLOYMENT_REQUESTS = REGISTRY.counter(
+    "wargaming_deployment_requests_total",
+    "Model calls per pool deployment by result: ok, throttled, server_error or client_error.",
+    ("deployment", "result"),
+)
+
+DEPLOYMENT_LATENCY_SECONDS = REGISTRY.histogram(
+    "wargaming_deployment_latency_seconds",
+    "Duration of successful model calls per pool deployment.",
+    ("deployment",),
+)
+
+DEPLOYMENT_EJECTIONS = REGISTRY.counter(
+    "wargaming_deployment_ejections_total",
+    "Times a pool deployment was taken out of rotation after a 429, 5xx or connection failure.",
+    ("deployment",),
+)
+
+HEDGES = REGISTRY.counter(
+    "wargaming_model_hedges_total",
+    "Model calls still running at the hedge delay: primary_won, hedge_won, both_failed, "
+    "or skipped_budget and skipped_no_deployment when no hedge was sent.",
+    ("result",),
+)
+
+
+def time_stage(stage: str):
+    """Time the enclosed block as one stage of a combat request."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def count_error(error: BaseException) -> None:
+    """Count an error by its exception type."""
+    ERRORS.inc(type=type(error).__name__)
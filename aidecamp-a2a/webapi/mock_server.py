@@ -7,38 +7,184 @@ Use this for testing and development when you don't have AI service credentials.
 For the real server with full Semantic Kernel and A2A support, use __main__.py instead.
 """
 
-import asyncio
+import email.parser
+import http.server
 import logging
 import os
 import json
-from io import BytesIO
+import random
+import time
 from pathlib import Path
+from typing import BinaryIO, Optional
 
 from dotenv import load_dotenv
 
 # Import only what we need that's already installed
-from models import CombatResult, ScenarioModel, ScenarioOutcome, Weapon, Pose
+from metrics import REGISTRY, count_error, time_stage
+from models import CombatResult, EngagementResult, ScenarioModel, ScenarioOutcome, Weapon, Pose
+from prompt_file import PromptFile
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# Size of each read from the socket while parsing uploads
+READ_CHUNK_SIZE = 64 * 1024
+
+MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+class MultipartError(ValueError):
+    """Raised when a multipart body is malformed."""
+
+
+class UploadTooLargeError(MultipartError):
+    """Raised when an uploaded file exceeds the size limit."""
+
+
+class UploadedFile:
+    """A file part extracted from a multipart body."""
+
+    def __init__(self, filename: str, content_type: str, data: bytes):
+        self.filename = filename
+        self.content_type = content_type
+        self.data = data
+
+
+def read_multipart_file(
+    stream: BinaryIO,
+    content_length: int,
+    boundary: bytes,
+    field_name: str = "image",
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> Optional[UploadedFile]:
+    """Stream a multipart/form-data body and return the named file part.
+
+    The body is read in fixed-size chunks and only the requested part is kept
+    in memory; every other part is discarded as it arrives. The whole body is
+    always consumed so the connection can be reused for the next request.
+
+    Args:
+        stream: The request body stream.
+        content_length: Number of body bytes to read.
+        boundary: The multipart boundary from the Content-Type header.
+        field_name: Form field holding the file.
+        max_bytes: Largest file accepted.
+
+    Returns:
+        The file part, or None if the body has no such field.
+
+    Raises:
+        UploadTooLargeError: If the file exceeds max_bytes.
+        MultipartError: If the body is malformed.
+    """
+    delimiter = b"\r\n--" + boundary
+    # Prefixing CRLF lets the first boundary match the same delimiter as the rest
+    buffer = b"\r\n"
+    remaining = content_length
+    state = "preamble"
+    current: Optional[dict] = None
+    found: Optional[UploadedFile] = None
+    too_large = False
+
+    while True:
+        if state == "preamble" or state == "boundary":
+            index = buffer.find(delimiter)
+            if index != -1 and len(buffer) >= index + len(delimiter) + 2:
+                suffix = buffer[index + len(delimiter):index + len(delimiter) + 2]
+                buffer = buffer[index + len(delimiter) + 2:]
+                if suffix == b"--":
+                    break
+                if suffix != b"\r\n":
+                    raise MultipartError("Malformed multipart boundary")
+                state = "headers"
+                continue
+            # Keep only a tail that could still hold the start of a boundary
+            buffer = buffer[-(len(delimiter) + 1):]
+        elif state == "headers":
+            index = buffer.find(b"\r\n\r\n")
+            if index != -1:
+                headers = email.parser.HeaderParser().parsestr(buffer[:index].decode("latin-1"))
+                buffer = buffer[index + 4:]
+                keep = headers.get_param("name", header="content-disposition") == field_name and found is None
+                current = {
+                    "keep": keep,
+                    "filename": headers.get_param("filename", "", header="content-disposition"),
+                    "content_type": headers.get("content-type", "application/octet-stream"),
+                    "chunks": [],
+                    "size": 0,
+                }
+                state = "body"
+                continue
+            if len(buffer) > MAX_PART_HEADER_BYTES:
+                raise MultipartError("Multipart part headers are too large")
+        else:
+            index = buffer.find(delimiter)
+            # Bytes that cannot be the start of a delimiter are safe to hand on
+            end = index if index != -1 else max(len(buffer) - len(delimiter), 0)
+            if end and current["keep"] and not too_large:
+                current["size"] += end
+                if current["size"] > max_bytes:
+                    too_large = True
+                    current["chunks"].clear()
+                else:
+                    current["chunks"].append(buffer[:end])
+            buffer = buffer[end:]
+            if index != -1:
+                if current["keep"] and not too_large:
+                    found = UploadedFile(
+                        current["filename"], current["content_type"], b"".join(current["chunks"])
+                    )
+                current = None
+                state = "boundary"
+                continue
+
+        if remaining <= 0:
+            if state == "preamble":
+                return None
+            raise MultipartError("Multipart body ended before the closing boundary")
+        chunk = stream.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise MultipartError("Connection closed before the body was read")
+        remaining -= len(chunk)
+        buffer += chunk
+
+    # Drain any epilogue so the next request on the connection starts cleanly
+    while remaining > 0:
+        chunk = stream.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+
+    if too_large:
+        raise UploadTooLargeError(f"Image exceeds the {max_bytes} byte upload limit")
+    return found
+
 
 class MockWargamingAgent:
-    """Mock wargaming agent for testing without AI dependencies."""
+    """Mock wargaming agent for testing without AI dependencies.
 
-    def __init__(self):
-        self.system_prompt = self._load_system_prompt()
+    Args:
+        latency_ms: Mean simulated model latency per image.
+        jitter_ms: Standard deviation of the simulated latency.
+    """
 
-    def _load_system_prompt(self) -> str:
-        """Load the system prompt from file."""
-        prompt_path = Path(__file__).parent / "data" / "prompts" / "prompt.md"
-        try:
-            return prompt_path.read_text(encoding="utf-8")
-        except FileNotFoundError:
-            logger.error(f"System prompt file not found: {prompt_path}")
-            return "You are a wargaming assistant."
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0):
+        self.prompt_file = PromptFile(
+            Path(__file__).parent / "data" / "prompts" / "prompt.md",
+            fallback="You are a wargaming assistant.",
+            check_interval_seconds=float(os.getenv('PROMPT_RELOAD_INTERVAL_SECONDS', '1')),
+        )
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    @property
+    def system_prompt(self) -> str:
+        """The system prompt, re-read only when the file changes."""
+        return self.prompt_file.text
 
     def _calculate_firing_modifier(self, weapon: Weapon) -> int:
         """Calculate firing modifier based on weapon type."""
@@ -65,8 +211,6 @@ class MockWargamingAgent:
 
     def _calculate_outcome(self, scenario: ScenarioModel) -> ScenarioOutcome:
         """Calculate the outcome using the same logic as the real server."""
-        import random
-        
         firing_modifier = self._calculate_firing_modifier(scenario.firing.weapon)
         target_modifier = self._calculate_target_modifier(scenario.target.pose)
         distance_modifier = self._calculate_distance_modifier(scenario.distance.value)
@@ -86,9 +230,17 @@ class MockWargamingAgent:
             hit_or_miss=hit_or_miss
         )
 
-    async def process_image_mock(self, image_bytes: bytes, user_input: str = "") -> CombatResult:
+    def _simulate_model_latency(self) -> None:
+        """Sleep for as long as a model call might take."""
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(random.gauss(self.latency_ms, self.jitter_ms), 0) / 1000)
+
+    def process_image_mock(self, image_bytes: bytes, user_input: str = "") -> CombatResult:
         """Mock image processing for testing - returns a sample scenario."""
         logger.info(f"Processing image of {len(image_bytes)} bytes")
+
+        with time_stage("model_call"):
+            self._simulate_model_latency()
         
         # Create a mock scenario for testing
         from models import Characteristics, Distance
@@ -100,31 +252,34 @@ class MockWargamingAgent:
         )
         
         # Calculate outcome using the same logic as the real server
-        outcome = self._calculate_outcome(scenario)
+        with time_stage("outcome_calculation"):
+            outcome = self._calculate_outcome(scenario)
         
-        return CombatResult(scenario=scenario, outcome=outcome)
+        engagement = EngagementResult(scenario=scenario, outcome=outcome)
+        return CombatResult(scenario=scenario, outcome=outcome, engagements=[engagement])
 
 
-def create_mock_http_server():
-    """Create a mock HTTP server without external AI dependencies."""
-    import http.server
-    import socketserver
-    import urllib.parse
-    import json
-    
+def create_mock_http_server(agent: Optional[MockWargamingAgent] = None, max_upload_bytes: int = MAX_UPLOAD_BYTES):
+    """Create a mock HTTP request handler without external AI dependencies.
+
+    Args:
+        agent: Agent shared by every request; one is created if not given.
+        max_upload_bytes: Largest image accepted by the combat endpoint.
+    """
+    agent = agent or MockWargamingAgent()
+
     class WargamingHandler(http.server.BaseHTTPRequestHandler):
-        
+        # HTTP/1.1 keeps connections open between requests
+        protocol_version = "HTTP/1.1"
+
         def do_GET(self):
             if self.path == "/" or self.path == "/api/":
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
                 response = {"message": "AI de Camp - Mock Wargaming Service (Testing)", "status": "running"}
-                self.wfile.write(json.dumps(response).encode())
+                self._send_json(200, response)
+            elif self.path == "/metrics":
+                self._send_body(200, REGISTRY.render().encode(), REGISTRY.CONTENT_TYPE)
             else:
-                self.send_response(404)
-                self.end_headers()
+                self._send_json(404, {"error": "Not found"})
         
         def do_OPTIONS(self):
             # Handle CORS preflight
@@ -132,20 +287,23 @@ def create_mock_http_server():
             self.send_header('Access-Control-Allow-Origin', '*')
             self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
             self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            self.send_header('Content-Length', '0')
             self.end_headers()
         
         def do_POST(self):
             if self.path == "/combat" or self.path == "/api/combat":
                 self._handle_combat()
             else:
-                self.send_response(404)
-                self.end_headers()
+                self._discard_body()
+                self._send_json(404, {"error": "Not found"})
         
         def _handle_combat(self):
             try:
                 # Parse multipart form data
-                content_type = self.headers.get('content-type')
-                if not content_type or not content_type.startswith('multipart/form-data'):
+                content_type = self.headers.get_content_type()
+                boundary = self.headers.get_param('boundary')
+                if content_type != 'multipart/form-data' or not boundary:
+                    self._discard_body()
                     self._send_error(400, "Expected multipart/form-data")
                     return
                 
@@ -154,42 +312,66 @@ def create_mock_http_server():
                 if content_length == 0:
                     self._send_error(400, "No content provided")
                     return
+                if content_length > max_upload_bytes + READ_CHUNK_SIZE:
+                    # Too large to be worth reading, so drop the connection instead
+                    self.close_connection = True
+                    self._send_error(413, f"Image exceeds the {max_upload_bytes} byte upload limit")
+                    return
                 
-                # Read the raw data
-                raw_data = self.rfile.read(content_length)
+                with time_stage("multipart_parse"):
+                    file = read_multipart_file(
+                        self.rfile, content_length, boundary.encode("latin-1"), "image", max_upload_bytes
+                    )
                 
-                # Look for image data in the multipart content
-                # This is a simplified parser - in production you'd use a proper library
-                if b'image' not in raw_data:
-                    self._send_error(400, "No image file found in upload")
+                if file is None or file.filename == "":
+                    self._send_error(400, "No image file uploaded.")
+                    return
+                if not file.content_type.startswith("image/"):
+                    self._send_error(400, "Uploaded file is not an image.")
                     return
                 
-                # Mock processing with sample data
-                agent = MockWargamingAgent()
-                result = asyncio.run(agent.process_image_mock(raw_data, ""))
-                
-                # Send response
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
+                # Mock processing with sample data on the shared agent
+                result = agent.process_image_mock(file.data, "")
                 
                 response_data = result.model_dump(by_alias=True)
-                self.wfile.write(json.dumps(response_data).encode())
+                self._send_json(200, response_data)
                 
                 logger.info("Successfully processed combat request")
                 
+            except UploadTooLargeError as e:
+                self._send_error(413, str(e))
+            except MultipartError as e:
+                # The body may be partly unread, so the connection cannot be reused
+                self.close_connection = True
+                self._send_error(400, str(e))
             except Exception as e:
+                count_error(e)
                 logger.error(f"Error processing combat request: {e}")
+                self.close_connection = True
                 self._send_error(500, f"Internal server error: {str(e)}")
+
+        def _discard_body(self):
+            remaining = int(self.headers.get('content-length', 0) or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
         
         def _send_error(self, code: int, message: str):
+            self._send_json(code, {"error": message})
+
+        def _send_json(self, code: int, payload: dict):
+            self._send_body(code, json.dumps(payload).encode(), 'application/json')
+
+        def _send_body(self, code: int, body: bytes, content_type: str):
+            # An explicit length lets the client reuse the connection
             self.send_response(code)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(len(body)))
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            error_response = {"error": message}
-            self.wfile.write(json.dumps(error_response).encode())
+            self.wfile.write(body)
         
         def log_message(self, format, *args):
             # Override to use our logger
@@ -200,16 +382,22 @@ def create_mock_http_server():
 
 def main():
     """Start the mock server for testing."""
-    import socketserver
-    
     PORT = int(os.getenv('PORT', 10020))
     HOST = os.getenv('HOST', 'localhost')
-    
-    Handler = create_mock_http_server()
-    
-    with socketserver.TCPServer((HOST, PORT), Handler) as httpd:
+
+    agent = MockWargamingAgent(
+        latency_ms=float(os.getenv('MOCK_MODEL_LATENCY_MS', '0')),
+        jitter_ms=float(os.getenv('MOCK_MODEL_JITTER_MS', '0')),
+    )
+    Handler = create_mock_http_server(agent, int(os.getenv('MAX_UPLOAD_BYTES', str(MAX_UPLOAD_BYTES))))
+
+    # One thread per connection, so slow clients and simulated model latency overlap
+    with http.server.ThreadingHTTPServer((HOST, PORT), Handler) as httpd:
+        httpd.daemon_threads = True
         logger.info(f"Starting mock server at http://{HOST}:{PORT}")
         logger.info(f"Combat endpoint: http://{HOST}:{PORT}/api/combat")
+        if agent.latency_ms or agent.jitter_ms:
+            logger.info(f"Simulating model latency of {agent.latency_ms} ms +/- {agent.jitter_ms} ms")
         logger.info("Note: This is a MOCK server for testing - returns hardcoded sample data")
         logger.info("For the real server with Semantic Kernel and A2A support, use: python __main__.py")
         try:
@@ -219,4 +407,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,26 @@
 """Data models for the wargaming scenario."""
 
+import re
 from enum import Enum
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import Any, Optional
+from pydantic import BaseModel, Field, model_validator
+
+
+def _normalize_label(value: str) -> str:
+    """Fold case, spaces and hyphens so label variants compare equal."""
+    return re.sub(r"[\s\-]+", "_", value.strip()).lower()
+
+
+def _match_label(enum_class: type[Enum], value: Any, aliases: dict[str, str]) -> Optional[Enum]:
+    """Find the enum member a model-written label refers to, or None."""
+    if not isinstance(value, str):
+        return None
+    label = _normalize_label(value)
+    label = aliases.get(label, label)
+    for member in enum_class:
+        if _normalize_label(member.value) == label:
+            return member
+    return None
 
 
 class Pose(str, Enum):
@@ -11,6 +29,11 @@ class Pose(str, Enum):
     CROUCHED = "crouched"
     PRONE = "prone"
 
+    @classmethod
+    def _missing_(cls, value: Any) -> Optional["Pose"]:
+        # Accept variants such as "Crouching" or "lying down" from the model
+        return _match_label(cls, value, POSE_ALIASES)
+
 
 class Weapon(str, Enum):
     """Weapon enumeration for toy soldiers."""
@@ -19,6 +42,29 @@ class Weapon(str, Enum):
     SMG = "SMG"
     RIFLE = "rifle"
 
+    @classmethod
+    def _missing_(cls, value: Any) -> Optional["Weapon"]:
+        # Accept variants such as "machine gun" or "submachine gun" from the model
+        return _match_label(cls, value, WEAPON_ALIASES)
+
+
+POSE_ALIASES = {
+    "stand": "standing",
+    "crouch": "crouched",
+    "crouching": "crouched",
+    "kneeling": "crouched",
+    "lying": "prone",
+    "lying_down": "prone",
+}
+
+WEAPON_ALIASES = {
+    "machinegun": "machine_gun",
+    "mg": "machine_gun",
+    "submachine_gun": "smg",
+    "sub_machine_gun": "smg",
+    "handgun": "pistol",
+}
+
 
 class Coordinates(BaseModel):
     """Coordinates of a toy soldier in the image."""
@@ -30,7 +76,8 @@ class Characteristics(BaseModel):
     """Characteristics of a toy soldier."""
     pose: Pose = Field(description="The pose of the toy soldier")
     weapon: Weapon = Field(description="The weapon of the toy soldier")
-    coordinates: Optional[Coordinates] = Field(None, description="Position in the image")
+    coordinates: Optional[Coordinates] = Field(None, description="Position of the centre of the base in the image")
+    height: Optional[int] = Field(None, description="Height in the image in pixels, from the bottom of the base to the top of the head")
 
 
 class Distance(BaseModel):
@@ -44,7 +91,28 @@ class ScenarioModel(BaseModel):
     """The wargame scenario model."""
     firing: Characteristics = Field(description="The characteristics of the firing toy soldier")
     target: Characteristics = Field(description="The characteristics of the target toy soldier")
-    distance: Distance = Field(description="The distance between the firing and target toy soldiers")
+    distance: Optional[Distance] = Field(
+        None,
+        description="The distance between the firing and target toy soldiers as given by the user, "
+        "otherwise estimated at 1:72 scale; it is cross-checked against a distance calculated "
+        "from the coordinates and heights",
+    )
+
+
+class TurnScenarioModel(BaseModel):
+    """Every engagement identified in one image."""
+    engagements: list[ScenarioModel] = Field(
+        min_length=1,
+        description="One scenario per firing and target pair on the table",
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def _wrap_single_scenario(cls, data: Any) -> Any:
+        # Accept a lone scenario, as cached before turns had several engagements
+        if isinstance(data, dict) and "engagements" not in data and "firing" in data:
+            return {"engagements": [data]}
+        return data
 
 
 class ScenarioOutcome(BaseModel):
@@ -59,7 +127,83 @@ class ScenarioOutcome(BaseModel):
         populate_by_name = True
 
 
-class CombatResult(BaseModel):
-    """Combined result containing both scenario and outcome."""
+class HitOdds(BaseModel):
+    """Exact, and optionally simulated, hit probability for one combination of rules inputs."""
+    weapon: Weapon = Field(description="The weapon of the firing toy soldier")
+    pose: Pose = Field(description="The pose of the target toy soldier")
+    distance: int = Field(description="The distance between the toy soldiers in cm")
+    firing_modifier: int = Field(alias="firing-modifier", description="The modifier of the firing toy soldier")
+    target_modifier: int = Field(alias="target-modifier", description="The modifier of the target toy soldier")
+    distance_modifier: int = Field(alias="distance-modifier", description="The modifier of the distance")
+    hit_probability: float = Field(alias="hit-probability", description="The exact probability of a hit")
+    simulated_hit_rate: Optional[float] = Field(None, alias="simulated-hit-rate", description="The hit rate over the simulated rolls")
+
+    class Config:
+        populate_by_name = True
+
+
+class OddsResult(BaseModel):
+    """Hit odds for a set of rules combinations."""
+    simulations: int = Field(description="The number of simulated rolls per combination, 0 if none")
+    odds: list[HitOdds] = Field(description="The odds, one entry per combination")
+
+
+class EngagementResult(BaseModel):
+    """Scenario and outcome of one engagement."""
     scenario: ScenarioModel = Field(description="The identified wargame scenario")
-    outcome: ScenarioOutcome = Field(description="The calculated outcome")
\ No newline at end of file
+    outcome: ScenarioOutcome = Field(description="The calculated outcome")
+
+
+class CombatResult(EngagementResult):
+    """Combined result containing both scenario and outcome.
+
+    The top-level scenario and outcome are the first engagement's, so clients
+    that expect one shot per image keep working.
+    """
+    engagements: list[EngagementResult] = Field(
+        default_factory=list, description="Every engagement identified in the image, in the order returned"
+    )
+
+
+class BatchItemResult(BaseModel):
+    """Result of one image in a batch, either a combat result or an error."""
+    index: int = Field(description="Position of the image in the batch")
+    filename: Optional[str] = Field(None, description="Uploaded file name, if any")
+    result: Optional[CombatResult] = Field(None, description="The combat result when the image was processed")
+    error: Optional[str] = Field(None, description="The error message when the image failed")
+
+
+class BatchCombatResult(BaseModel):
+    """Results of a batch of images, in upload order."""
+    results: list[BatchItemResult] = Field(description="One entry per uploaded image")
+
+
+def strict_json_schema(model: type[BaseModel]) -> dict[str, Any]:
+    """Return the JSON schema of a model in the form strict structured outputs accept.
+
+    Every object lists all of its properties as required and forbids extra
+    ones; optional fields stay nullable. Titles and defaults are dropped, as
+    are keywords next to a $ref, which strict mode rejects.
+    """
+    def strictify(node: Any) -> Any:
+        if isinstance(node, list):
+            return [strictify(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        if "$ref" in node:
+            return {"$ref": node["$ref"]}
+        strict = {}
+        for key, value in node.items():
+            if key in ("title", "default"):
+                continue
+            if key in ("properties", "$defs"):
+                # Keys here are names, not keywords, so only their schemas change
+                strict[key] = {name: strictify(schema) for name, schema in value.items()}
+            else:
+                strict[key] = strictify(value)
+        if strict.get("type") == "object" and "properties" in strict:
+            strict["required"] = list(strict["properties"])
+            strict["additionalProperties"] = False
+        return strict
+
+    return strictify(model.model_json_schema())
@@ -0,0 +1,73 @@
+"""Prompt file loaded once and reloaded when it changes on disk."""
+
+import logging
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class PromptFile:
+    """Serves a prompt from memory, re-reading the file only after it is modified.
+
+    The file's modification time and size are checked at most once per check
+    interval, so reading the prompt on every request costs no disk access.
+
+    Args:
+        path: Prompt file to read.
+        fallback: Text used while the file is missing.
+        check_interval_seconds: Minimum time between checks for changes; 0 checks on every read.
+    """
+
+    def __init__(self, path: Path, fallback: str = "", check_interval_seconds: float = 1.0):
+        self.path = Path(path)
+        self.fallback = fallback
+        self.check_interval_seconds = check_interval_seconds
+        self._text = fallback
+        self._signature: tuple[int, int] | None = None
+        self._checked_at = float("-inf")
+        self._reloads = 0
+        self._missing = False
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @property
+    def text(self) -> str:
+        """The current prompt text."""
+        if time.monotonic() - self._checked_at >= self.check_interval_seconds:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval_seconds:
+                    self._refresh()
+        return self._text
+
+    @property
+    def reloads(self) -> int:
+        """Number of times the file was re-read after a change."""
+        return self._reloads
+
+    def _refresh(self) -> None:
+        self._checked_at = time.monotonic()
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            if not self._missing:
+                # The last prompt read stays in use until the file comes back
+                logger.error(f"System prompt file not found: {self.path}")
+                self._missing = True
+            return
+        self._missing = False
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        try:
+            text = self.path.read_text(encoding="utf-8")
+        except OSError as e:
+            logger.error(f"Could not read prompt file {self.path}: {e}")
+            return
+        if self._signature is not None:
+            self._reloads += 1
+            logger.info(f"Reloaded prompt file {self.path}")
+        self._signature = signature
+        self._text = text
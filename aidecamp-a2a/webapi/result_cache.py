@@ -0,0 +1,143 @@
+"""Content-addressed cache of identified wargame scenarios."""
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from models import TurnScenarioModel
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(image_bytes: bytes, user_input: str = "", context: str = "") -> str:
+    """Return the cache key for an image, the user text sent with it and the context it was asked in.
+
+    Args:
+        image_bytes: The uploaded image.
+        user_input: User text sent with the image.
+        context: The conversation the answer depends on; empty when it depends on none.
+    """
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b"\0")
+    digest.update(user_input.encode("utf-8"))
+    if context:
+        digest.update(b"\0")
+        digest.update(context.encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass
+class ResultCacheStats:
+    """Snapshot of result cache counters."""
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+
+
+class ResultCache:
+    """Two-tier cache of parsed scenarios keyed by image and text hash.
+
+    The in-memory tier is an LRU; the optional SQLite tier survives restarts
+    and is consulted on memory misses. Only scenarios are cached, never
+    outcomes, so dice are still rolled for every request.
+
+    Args:
+        max_entries: Maximum number of scenarios kept in memory.
+        db_path: Optional SQLite file for the persistent tier.
+        max_disk_entries: Maximum number of scenarios kept on disk; 0 disables the limit.
+    """
+
+    def __init__(self, max_entries: int = 1024, db_path: Optional[str] = None, max_disk_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, TurnScenarioModel] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scenarios ("
+                "key TEXT PRIMARY KEY, scenario TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS scenarios_created ON scenarios (created)")
+            self._db.commit()
+            # Serializes access to the shared connection from worker threads
+            self._db_lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[TurnScenarioModel]:
+        """Return the cached scenario for a key, or None on a miss."""
+        scenario = self._memory.get(key)
+        if scenario is not None:
+            self._memory.move_to_end(key)
+            self._hits += 1
+            return scenario
+
+        if self._db is not None:
+            async with self._db_lock:
+                row = await asyncio.to_thread(self._db_get, key)
+            if row is not None:
+                # Rows written before multi-engagement turns hold a lone scenario
+                scenario = TurnScenarioModel.model_validate_json(row)
+                self._memory_put(key, scenario)
+                self._hits += 1
+                return scenario
+
+        self._misses += 1
+        return None
+
+    async def put(self, key: str, scenario: TurnScenarioModel) -> None:
+        """Store a scenario in both tiers."""
+        self._memory_put(key, scenario)
+        if self._db is not None:
+            async with self._db_lock:
+                await asyncio.to_thread(self._db_put, key, scenario.model_dump_json())
+
+    def stats(self) -> ResultCacheStats:
+        return ResultCacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            entries=len(self._memory),
+        )
+
+    def close(self) -> None:
+        """Close the SQLite tier, if any."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _memory_put(self, key: str, scenario: TurnScenarioModel) -> None:
+        self._memory[key] = scenario
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def _db_get(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT scenario FROM scenarios WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _db_put(self, key: str, scenario_json: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO scenarios (key, scenario, created) VALUES (?, ?, ?)",
+            (key, scenario_json, time.time()),
+        )
+        if self.max_disk_entries > 0:
+            cursor = self._db.execute(
+                "DELETE FROM scenarios WHERE key IN ("
+                "SELECT key FROM scenarios ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self._evictions += cursor.rowcount
+        self._db.commit()
@@ -0,0 +1,142 @@
+"""Session history stores for the wargaming agent."""
+
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from semantic_kernel.contents import ChatHistory, ImageContent, TextContent
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_history_size(history: ChatHistory) -> int:
+    """Estimate the memory held by a chat history, in bytes.
+
+    Image payloads dominate, so only image data and text are counted.
+    """
+    size = 0
+    for message in history.messages:
+        for item in message.items:
+            if isinstance(item, ImageContent):
+                size += len(item.data or b"")
+            elif isinstance(item, TextContent):
+                size += len(item.text.encode("utf-8"))
+    return size
+
+
+@dataclass
+class SessionStoreStats:
+    """Snapshot of a session store's occupancy and eviction counters."""
+    entries: int
+    size_bytes: int
+    evictions: int
+
+
+class SessionStore(ABC):
+    """Interface for storing chat histories keyed by session id."""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[ChatHistory]:
+        """Return the history for a session, or None if absent or expired."""
+
+    @abstractmethod
+    def put(self, session_id: str, history: ChatHistory) -> None:
+        """Store or refresh the history for a session."""
+
+    @abstractmethod
+    def pop(self, session_id: str) -> Optional[ChatHistory]:
+        """Remove and return the history for a session."""
+
+    @abstractmethod
+    def stats(self) -> SessionStoreStats:
+        """Return the current entry count, byte size and eviction count."""
+
+
+class InMemorySessionStore(SessionStore):
+    """In-memory session store with LRU, idle-TTL and total-bytes eviction.
+
+    Args:
+        max_entries: Maximum number of sessions kept; 0 disables the limit.
+        ttl_seconds: Idle time after which a session expires; 0 disables expiry.
+        max_bytes: Maximum total estimated size of all sessions; 0 disables the limit.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # session id -> (history, size in bytes, last access time), oldest first
+        self._entries: OrderedDict[str, tuple[ChatHistory, int, float]] = OrderedDict()
+        self._size_bytes = 0
+        self._evictions = 0
+
+    def get(self, session_id: str) -> Optional[ChatHistory]:
+        self._expire()
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        history, size, _ = entry
+        self._entries[session_id] = (history, size, time.monotonic())
+        self._entries.move_to_end(session_id)
+        return history
+
+    def put(self, session_id: str, history: ChatHistory) -> None:
+        self._remove(session_id)
+        size = estimate_history_size(history)
+        self._entries[session_id] = (history, size, time.monotonic())
+        self._size_bytes += size
+        self._expire()
+        self._evict(keep=session_id)
+
+    def pop(self, session_id: str) -> Optional[ChatHistory]:
+        return self._remove(session_id)
+
+    def stats(self) -> SessionStoreStats:
+        return SessionStoreStats(
+            entries=len(self._entries),
+            size_bytes=self._size_bytes,
+            evictions=self._evictions,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def _remove(self, session_id: str) -> Optional[ChatHistory]:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return None
+        self._size_bytes -= entry[1]
+        return entry[0]
+
+    def _expire(self) -> None:
+        """Drop sessions idle for longer than the TTL."""
+        if self.ttl_seconds <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            session_id, (_, _, last_access) = next(iter(self._entries.items()))
+            if last_access > deadline:
+                break
+            self._remove(session_id)
+            self._evictions += 1
+            logger.info(f"Session expired: {session_id}")
+
+    def _evict(self, keep: str) -> None:
+        """Drop least recently used sessions until both caps are met."""
+        while self._entries and (
+            (self.max_entries > 0 and len(self._entries) > self.max_entries)
+            or (self.max_bytes > 0 and self._size_bytes > self.max_bytes)
+        ):
+            session_id = next(iter(self._entries))
+            if session_id == keep:
+                # The session just written is the only one left over the cap
+                break
+            self._remove(session_id)
+            self._evictions += 1
+            logger.info(f"Session evicted: {session_id}")
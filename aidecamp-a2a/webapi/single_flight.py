@@ -0,0 +1,69 @@
+"""Coalescing of concurrent identical calls into one in-flight call."""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call(Generic[T]):
+    """An in-flight call and the number of callers waiting on it."""
+
+    def __init__(self, task: "asyncio.Task[T]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """Runs at most one call per key at a time and shares its result.
+
+    Callers arriving while a call for the same key is in flight wait for that
+    call instead of starting their own. A caller being cancelled does not
+    cancel the shared call unless it was the last one waiting on it.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, _Call[T]] = {}
+        self._coalesced = 0
+
+    @property
+    def coalesced(self) -> int:
+        """Number of callers that joined a call already in flight."""
+        return self._coalesced
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        return len(self._calls)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of fn, sharing it with concurrent callers of the same key."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._forget(key, call))
+        else:
+            self._coalesced += 1
+            logger.info(f"Joined in-flight call for {key[:12]}")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Nobody else wants the result, so stop paying for it
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call[T]) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # Mark the exception retrieved even if every waiter has gone
+            call.task.exception()
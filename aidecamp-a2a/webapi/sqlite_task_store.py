@@ -0,0 +1,108 @@
+"""SQLite-backed A2A task store with TTL-based expiry."""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+from a2a.server.tasks import TaskStore
+from a2a.types import Task
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteTaskStore(TaskStore):
+    """Persists A2A tasks in SQLite so they survive restarts and stay off the heap.
+
+    Tasks not updated within the TTL are treated as missing and purged
+    periodically. The database runs in WAL mode so reads do not block the
+    writer, and tasks are indexed by id and contextId.
+
+    Args:
+        db_path: SQLite database file.
+        ttl_seconds: Time after the last update at which a task expires; 0 disables expiry.
+        purge_interval_seconds: Minimum time between purges of expired tasks.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = 86400, purge_interval_seconds: float = 60):
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval_seconds = purge_interval_seconds
+        self._last_purge = 0.0
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id TEXT PRIMARY KEY, context_id TEXT NOT NULL, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_context_id ON tasks (context_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (updated)")
+        self._db.commit()
+        # Serializes access to the shared connection from worker threads
+        self._lock = asyncio.Lock()
+
+    async def save(self, task: Task) -> None:
+        """Saves or updates a task in the store."""
+        async with self._lock:
+            await asyncio.to_thread(self._save, task.id, task.contextId, task.model_dump_json())
+            if time.monotonic() - self._last_purge >= self.purge_interval_seconds:
+                self._last_purge = time.monotonic()
+                await asyncio.to_thread(self._purge_expired)
+
+    async def get(self, task_id: str) -> Task | None:
+        """Retrieves a task from the store by ID."""
+        async with self._lock:
+            row = await asyncio.to_thread(
+                self._fetch_one,
+                "SELECT data FROM tasks WHERE id = ? AND updated >= ?",
+                (task_id, self._expiry_cutoff()),
+            )
+        return Task.model_validate_json(row[0]) if row else None
+
+    async def get_by_context(self, context_id: str) -> list[Task]:
+        """Retrieves all live tasks of a context, oldest first."""
+        async with self._lock:
+            rows = await asyncio.to_thread(
+                self._fetch_all,
+                "SELECT data FROM tasks WHERE context_id = ? AND updated >= ? ORDER BY updated",
+                (context_id, self._expiry_cutoff()),
+            )
+        return [Task.model_validate_json(row[0]) for row in rows]
+
+    async def delete(self, task_id: str) -> None:
+        """Deletes a task from the store by ID."""
+        async with self._lock:
+            await asyncio.to_thread(self._execute, "DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._db.close()
+
+    def _expiry_cutoff(self) -> float:
+        return time.time() - self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+
+    def _save(self, task_id: str, context_id: str, data: str) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO tasks (id, context_id, data, updated) VALUES (?, ?, ?, ?)",
+            (task_id, context_id, data, time.time()),
+        )
+
+    def _purge_expired(self) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        cursor = self._db.execute("DELETE FROM tasks WHERE updated < ?", (self._expiry_cutoff(),))
+        self._db.commit()
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} expired tasks")
+
+    def _execute(self, sql: str, parameters: tuple) -> None:
+        self._db.execute(sql, parameters)
+        self._db.commit()
+
+    def _fetch_one(self, sql: str, parameters: tuple):
+        return self._db.execute(sql, parameters).fetchone()
+
+    def _fetch_all(self, sql: str, parameters: tuple) -> list:
+        return self._db.execute(sql, parameters).fetchall()
@@ -1,18 +1,43 @@
 """Turn manager for calculating wargame outcomes."""
 
+import itertools
+import logging
+import math
 import random
-from typing import Annotated
+from typing import Annotated, Iterable, Optional
 
+import numpy as np
 from semantic_kernel.functions import kernel_function
 
-from models import ScenarioModel, ScenarioOutcome, Weapon, Pose
+from metrics import DISTANCE_DISCREPANCY_CM, DISTANCE_SOURCES
+from models import Distance, HitOdds, OddsResult, ScenarioModel, ScenarioOutcome, TurnScenarioModel, Weapon, Pose
+
+logger = logging.getLogger(__name__)
+
+DICE_SIDES = 20
+
+# Distance from which the long-range modifier applies, in cm
+LONG_RANGE_CM = 70
+
+# Height of a 1:72 toy soldier from the bottom of its base to the top of its head, in cm
+SOLDIER_HEIGHT_CM = {
+    Pose.STANDING: 2.5,
+    Pose.CROUCHED: 1.8,
+    Pose.PRONE: 1.0,
+}
 
 
 class TurnManagerPlugin:
     """Plugin for calculating wargame scenario outcomes."""
 
-    def __init__(self):
+    def __init__(self, distance_tolerance_cm: float = 10):
+        self.distance_tolerance_cm = distance_tolerance_cm
         self._random = random.Random()
+        self._rng = np.random.default_rng()
+        # Exact odds for every weapon, pose and range band, precomputed once
+        self.odds_table = self.calculate_odds_grid(
+            list(Weapon), list(Pose), [0, LONG_RANGE_CM]
+        ).odds
 
     @kernel_function(
         name="calculate_outcome",
@@ -22,16 +47,19 @@ class TurnManagerPlugin:
         self, scenario: Annotated[ScenarioModel, "The wargame scenario"]
     ) -> Annotated[ScenarioOutcome, "The outcome of the wargame scenario"]:
         """Calculate the outcome of a wargame scenario."""
-        print("Calculating outcome of the wargame scenario")
-        print(f"Firing: {scenario.firing.pose} {scenario.firing.weapon}")
-        print(f"Target: {scenario.target.pose} {scenario.target.weapon}")
-        print(f"Distance: {scenario.distance.value} {scenario.distance.unit}")
+        if scenario.distance is None:
+            scenario = self.resolve_distance(scenario)
+        logger.debug(
+            f"Calculating outcome: firing {scenario.firing.pose} {scenario.firing.weapon}, "
+            f"target {scenario.target.pose} {scenario.target.weapon}, "
+            f"distance {scenario.distance.value} {scenario.distance.unit}"
+        )
 
         firing_modifier = self._calculate_firing_modifier(scenario.firing.weapon)
         target_modifier = self._calculate_target_modifier(scenario.target.pose)
         distance_modifier = self._calculate_distance_modifier(scenario.distance.value)
 
-        rolled_dice = self._random.randint(1, 20)
+        rolled_dice = self._random.randint(1, DICE_SIDES)
         total_modifiers = firing_modifier + target_modifier + distance_modifier
         hit_or_miss = rolled_dice > total_modifiers
 
@@ -43,6 +71,169 @@ class TurnManagerPlugin:
             hit_or_miss=hit_or_miss,
         )
 
+    @kernel_function(
+        name="calculate_outcomes",
+        description="Calculate the outcome of every engagement in a wargame turn, rolling all dice in one pass.",
+    )
+    def calculate_outcomes(
+        self, turn: Annotated[TurnScenarioModel, "The engagements identified in one image"]
+    ) -> Annotated[list[ScenarioOutcome], "The outcomes, one per engagement in order"]:
+        """Calculate the outcomes of all engagements in a turn.
+
+        Modifiers are looked up per engagement, then one vectorized draw rolls
+        a die for each, so a whole table costs a single pass.
+        """
+        engagements = [
+            scenario if scenario.distance is not None else self.resolve_distance(scenario)
+            for scenario in turn.engagements
+        ]
+        firing = np.array([self._calculate_firing_modifier(s.firing.weapon) for s in engagements])
+        target = np.array([self._calculate_target_modifier(s.target.pose) for s in engagements])
+        distance = np.array([self._calculate_distance_modifier(s.distance.value) for s in engagements])
+        rolled_dice = self._rng.integers(1, DICE_SIDES + 1, size=len(engagements))
+        hits = rolled_dice > firing + target + distance
+        logger.debug(f"Calculated {len(engagements)} outcomes, {int(hits.sum())} hits")
+
+        return [
+            ScenarioOutcome(
+                firing_modifier=int(firing[i]),
+                target_modifier=int(target[i]),
+                distance_modifier=int(distance[i]),
+                rolled_dice=int(rolled_dice[i]),
+                hit_or_miss=bool(hits[i]),
+            )
+            for i in range(len(engagements))
+        ]
+
+    @kernel_function(
+        name="calculate_odds",
+        description="Calculate the probability that the firing toy soldier hits the target in the wargame scenario.",
+    )
+    def calculate_odds(
+        self,
+        scenario: Annotated[ScenarioModel, "The wargame scenario"],
+        simulations: Annotated[int, "Number of dice rolls to simulate, 0 for exact odds only"] = 0,
+    ) -> Annotated[HitOdds, "The hit probability of the wargame scenario"]:
+        """Calculate the hit probability of a wargame scenario."""
+        if scenario.distance is None:
+            scenario = self.resolve_distance(scenario)
+        return self.calculate_odds_grid(
+            [scenario.firing.weapon], [scenario.target.pose], [scenario.distance.value], simulations
+        ).odds[0]
+
+    @kernel_function(
+        name="calculate_distance",
+        description="Calculate the distance in cm between the firing and target toy soldiers from their positions and heights in the image.",
+    )
+    def calculate_distance(
+        self, scenario: Annotated[ScenarioModel, "The wargame scenario"]
+    ) -> Annotated[Optional[Distance], "The estimated distance, or None without coordinates and heights"]:
+        """Calculate the distance between the soldiers from image coordinates.
+
+        Each soldier's height in pixels against its real height for its pose
+        gives a pixels-per-cm scale; the two scales are averaged to soften the
+        perspective difference between them.
+        """
+        soldiers = (scenario.firing, scenario.target)
+        if any(soldier.coordinates is None for soldier in soldiers):
+            return None
+        scales = [
+            soldier.height / SOLDIER_HEIGHT_CM[soldier.pose]
+            for soldier in soldiers
+            if soldier.height and soldier.height > 0
+        ]
+        if not scales:
+            return None
+
+        pixels = math.dist(
+            (scenario.firing.coordinates.x, scenario.firing.coordinates.y),
+            (scenario.target.coordinates.x, scenario.target.coordinates.y),
+        )
+        return Distance(value=round(pixels / (sum(scales) / len(scales))), unit="cm", estimated=True)
+
+    def resolve_distance(self, scenario: ScenarioModel) -> ScenarioModel:
+        """Return the scenario with the distance the rules should use.
+
+        A distance given by the user is kept. Otherwise the distance
+        calculated from the image replaces the model's estimate, which is
+        only used when there is nothing to calculate from. Any second value
+        cross-checks the one used.
+
+        Raises:
+            ValueError: If there is no distance and none can be calculated.
+        """
+        calculated = self.calculate_distance(scenario)
+        given = scenario.distance
+
+        if given is not None and calculated is not None:
+            discrepancy = abs(given.value - calculated.value)
+            DISTANCE_DISCREPANCY_CM.observe(discrepancy)
+            if discrepancy > self.distance_tolerance_cm:
+                logger.info(
+                    f"Distance {'given' if not given.estimated else 'estimated by the model'} as "
+                    f"{given.value} {given.unit} but calculated as {calculated.value} cm"
+                )
+
+        if given is not None and not given.estimated:
+            DISTANCE_SOURCES.inc(source="user")
+            return scenario
+        if calculated is not None:
+            DISTANCE_SOURCES.inc(source="calculated")
+            return scenario.model_copy(update={"distance": calculated})
+        if given is not None:
+            DISTANCE_SOURCES.inc(source="model")
+            return scenario
+        DISTANCE_SOURCES.inc(source="none")
+        raise ValueError("No distance was given and it cannot be calculated without coordinates and heights")
+
+    def calculate_odds_grid(
+        self,
+        weapons: Iterable[Weapon],
+        poses: Iterable[Pose],
+        distances: Iterable[int],
+        simulations: int = 0,
+    ) -> OddsResult:
+        """Calculate hit odds for every weapon x pose x distance combination.
+
+        A hit needs a roll strictly above the total modifier, so the exact
+        probability is the share of die faces above it. The optional Monte
+        Carlo draws one vectorized sample of rolls and tallies it per face,
+        which makes the cost per combination independent of the sample size.
+        """
+        combinations = list(itertools.product(weapons, poses, distances))
+        if not combinations:
+            return OddsResult(simulations=simulations, odds=[])
+
+        firing = np.array([self._calculate_firing_modifier(weapon) for weapon, _, _ in combinations])
+        target = np.array([self._calculate_target_modifier(pose) for _, pose, _ in combinations])
+        distance = np.array([self._calculate_distance_modifier(value) for _, _, value in combinations])
+        totals = firing + target + distance
+
+        hit_probability = np.clip(DICE_SIDES - totals, 0, DICE_SIDES) / DICE_SIDES
+
+        simulated_hit_rate = None
+        if simulations > 0:
+            rolls = self._rng.integers(1, DICE_SIDES + 1, size=simulations)
+            face_counts = np.bincount(rolls, minlength=DICE_SIDES + 1)
+            # rolls_above[t] = number of rolls strictly greater than t
+            rolls_above = simulations - np.cumsum(face_counts)
+            simulated_hit_rate = rolls_above[np.clip(totals, 0, DICE_SIDES)] / simulations
+
+        odds = [
+            HitOdds(
+                weapon=weapon,
+                pose=pose,
+                distance=value,
+                firing_modifier=int(firing[i]),
+                target_modifier=int(target[i]),
+                distance_modifier=int(distance[i]),
+                hit_probability=float(hit_probability[i]),
+                simulated_hit_rate=float(simulated_hit_rate[i]) if simulated_hit_rate is not None else None,
+            )
+            for i, (weapon, pose, value) in enumerate(combinations)
+        ]
+        return OddsResult(simulations=simulations, odds=odds)
+
     def _calculate_firing_modifier(self, weapon: Weapon) -> int:
         """Calculate the firing modifier based on weapon type."""
         weapon_modifiers = {
@@ -64,4 +255,4 @@ class TurnManagerPlugin:
 
     def _calculate_distance_modifier(self, distance: int) -> int:
         """Calculate the distance modifier based on distance in cm."""
-        return 3 if distance >= 70 else 0
\ No newline at end of file
+        return 3 if distance >= LONG_RANGE_CM else 0
@@ -0,0 +1,124 @@
+"""Archive of uploaded images, written off the event loop with bounded disk usage."""
+
+import asyncio
+import hashlib
+import logging
+import random
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# Upload MIME type -> file extension for archived images
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+class UploadStore:
+    """Saves uploads under content-addressed names and sweeps old files.
+
+    Args:
+        directory: Folder the uploads are written to.
+        enabled: Whether uploads are archived at all.
+        sample_rate: Fraction of uploads archived, between 0 and 1.
+        retention_bytes: Disk usage above which the oldest uploads are deleted; 0 disables the sweep.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        enabled: bool = True,
+        sample_rate: float = 1.0,
+        retention_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.retention_bytes = retention_bytes
+        self._random = random.Random()
+        # Background writes still in flight, kept referenced until done
+        self._pending: set[asyncio.Task] = set()
+
+    async def save(self, image_bytes: bytes, content_type: str = "image/jpeg") -> Optional[Path]:
+        """Archive an upload, returning its path, or None if it was not sampled."""
+        if not self.enabled or self._random.random() >= self.sample_rate:
+            return None
+        name = hashlib.sha256(image_bytes).hexdigest() + _EXTENSIONS.get(content_type, ".bin")
+        file_path = self.directory / name
+        with time_stage("upload_write"):
+            await asyncio.to_thread(self._write, file_path, image_bytes)
+        return file_path
+
+    def save_in_background(self, image_bytes: bytes, content_type: str = "image/jpeg") -> None:
+        """Archive an upload without making the caller wait for the write."""
+        task = asyncio.create_task(self.save(image_bytes, content_type))
+        self._pending.add(task)
+        task.add_done_callback(self._on_saved)
+
+    def _on_saved(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Failed to archive upload: {task.exception()}")
+        elif task.result() is not None:
+            logger.info(f"Image saved to: {task.result()}")
+
+    async def drain(self) -> None:
+        """Wait for background writes to finish."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def _write(self, file_path: Path, image_bytes: bytes) -> None:
+        if file_path.exists():
+            # Same content, same name: nothing to write
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        temp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.tmp")
+        temp_path.write_bytes(image_bytes)
+        temp_path.replace(file_path)
+
+    def sweep(self) -> int:
+        """Delete the oldest uploads until usage is within the retention cap.
+
+        Returns:
+            int: The number of bytes freed.
+        """
+        if self.retention_bytes <= 0 or not self.directory.exists():
+            return 0
+        files = []
+        total = 0
+        for path in self.directory.iterdir():
+            if not path.is_file() or path.suffix == ".tmp":
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        freed = 0
+        files.sort()
+        for _, size, path in files:
+            if total - freed <= self.retention_bytes:
+                break
+            path.unlink(missing_ok=True)
+            freed += size
+        if freed:
+            logger.info(f"Upload sweep freed {freed} bytes in {self.directory}")
+        return freed
+
+    async def run_sweeper(self, interval_seconds: float) -> None:
+        """Sweep periodically until cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except OSError as e:
+                logger.warning(f"Upload sweep failed: {e}")
+            await asyncio.sleep(interval_seconds)